@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import glob
+import json
+import hashlib
+import logging
+import functools
+from typing import Any
+
+MANIFEST_VERSION = 1
+
+# Bump when outputs change without a change of the prebuilder files, like
+# with a new version of a dependency.
+GENERATOR_VERSION = 1
+
+
+class BuildManifest:
+    def __init__(self, source_path: str, target_path: str):
+        self.source_path = source_path
+        self.target_path = target_path
+        # Examples:
+        # - /data/output/material_2/build.manifest.json
+        # - /data/output/material_2/data.manifest.json
+        self.path = target_path.rstrip("/") + ".manifest.json"
+        self.stages: dict[str, dict[str, Any]] = self._load()
+        # Known hashes of input files, to skip hashing unchanged ones.
+        self.hashes: dict[str, list[Any]] = {}
+        for stage in self.stages.values():
+            self.hashes |= stage["inputs"]
+
+    def exists(self) -> bool:
+        """Check if a previous build recorded anything"""
+        return bool(self.stages)
+
+    @staticmethod
+    def remove(target_path: str) -> None:
+        """Delete the manifest of a target path, before a full rebuild"""
+        path = target_path.rstrip("/") + ".manifest.json"
+        if os.path.exists(path):
+            os.remove(path)
+
+    def fingerprint(self, paths: list[str], extra: list[str]) -> dict[str, Any]:
+        """Hash input files and extra values of a stage"""
+        inputs = {}
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            key = os.path.relpath(path, self.source_path)
+            inputs[key] = self._hash_file(path, self.hashes.get(key))
+            digest.update((key + "\0" + inputs[key][2] + "\0").encode())
+        for value in extra:
+            digest.update((value + "\0").encode())
+        # Outputs of another prebuilder are stale, like after an image upgrade.
+        digest.update(BuildManifest.prebuilder_fingerprint().encode())
+        return {"digest": digest.hexdigest(), "inputs": inputs}
+
+    @staticmethod
+    @functools.cache
+    def prebuilder_fingerprint() -> str:
+        """Hash the code and templates of the prebuilder itself"""
+        root_path = os.path.dirname(os.path.abspath(__file__))
+        paths = glob.glob(os.path.join(root_path, "*.py"))
+        paths += glob.glob(os.path.join(root_path, "templates", "*.jinja"))
+        digest = hashlib.sha256(str(GENERATOR_VERSION).encode())
+        for path in sorted(paths):
+            with open(path, "rb") as file:
+                content = file.read()
+            digest.update(os.path.relpath(path, root_path).encode() + b"\0")
+            digest.update(hashlib.sha256(content).digest())
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: str, fingerprint: dict[str, Any]) -> bool:
+        """Check if inputs of a stage are unchanged and its outputs still there"""
+        if stage not in self.stages:
+            return False
+        if self.stages[stage]["digest"] != fingerprint["digest"]:
+            return False
+        for key, output_hash in self.stages[stage]["outputs"].items():
+            path = os.path.join(self.target_path, key)
+            if self._hash_file(path, output_hash)[2] != output_hash[2]:
+                return False
+        return True
+
+    def record(
+        self, stage: str, fingerprint: dict[str, Any], output_paths: list[str]
+    ) -> None:
+        """Store fingerprint and outputs of a stage, and prune its stale outputs"""
+        previous = self.stages.get(stage, {"outputs": {}})
+        outputs = {}
+        for path in output_paths:
+            key = os.path.relpath(path, self.target_path)
+            outputs[key] = self._hash_file(path, previous["outputs"].get(key))
+        for key in previous["outputs"].keys() - outputs.keys():
+            self._prune(os.path.join(self.target_path, key))
+        self.stages[stage] = fingerprint | {"outputs": outputs}
+
+    def save(self) -> None:
+        """Write the manifest next to the target folder"""
+        content = {"version": MANIFEST_VERSION, "stages": self.stages}
+        with open(self.path, "w") as file:
+            json.dump(content, file)
+
+    def _load(self) -> dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            logging.warning("Unreadable manifest %s, full rebuild", self.path)
+            return {}
+        if content.get("version") != MANIFEST_VERSION:
+            return {}
+        return dict(content["stages"])
+
+    def _hash_file(self, path: str, known: list[Any] | None) -> list[Any]:
+        # [size, mtime, sha256], the known hash is reused if not touched.
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return [-1, 0, ""]
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known
+        with open(path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        return [stat.st_size, stat.st_mtime_ns, digest]
+
+    def _prune(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        logging.info("PRUNE %s", path)
+        os.remove(path)
+        folder = os.path.dirname(path)
+        root = self.target_path.rstrip("/")
+        while folder.startswith(root + "/") and not os.listdir(folder):
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
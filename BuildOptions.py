@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+# Choices of the build options, apart from the generators using them, so the
+# command line and the server check them without loading the generators.
+
+# How component_renderable dispatches on the @component property:
+# - conditional: an anyOf with an if/then/else branch for each component
+# - discriminator: a oneOf of const discriminated branches, validators
+#   supporting the "discriminator" keyword (like Ajv) jump to the right one
+SCHEMA_MODES = ["conditional", "discriminator"]
+
+# Rust emission modes:
+# - runtime: config() fills HashMaps and Vecs at renderer startup
+# - static: static slices and phf maps, compiled in the binary as data, with
+#   a config() building the same SystemConfig from them
+RUST_TEMPLATES = {
+    "runtime": "rust.jinja",
+    "static": "rust_static.jinja",
+}
+
+# How examples are written:
+# - files: a JSON file for each example, in examples/ and tests/
+# - bundle: every example in examples.ndjson, a compact JSON document per
+#   line, with examples.index.json giving the [offset, length] in bytes of
+#   each one, keyed like the files: examples/album, tests/card--default
+EXAMPLES_FORMATS = ["files", "bundle"]
@@ -1,39 +1,27 @@
 #!/usr/bin/env python3
 
 from FileSystemManager import FileSystemManager
+from SourceIndex import SourceIndex, ARTIFACTS, CONFIG_KEY
+from YamlLoader import YamlLoader
+from UrlClassifier import UrlClassifier
 import os
-import sys
-import yaml
-from yaml.loader import SafeLoader
-import glob
-import stat
-import validators
-import json
 import logging
-import coloredlogs
-from typing import Any
+from typing import Any, Callable, Iterable
 
 DEFAULT_CDN_ROOT = "https://data.dilla.io"
 
-coloredlogs.install(level="INFO", stream=sys.stdout)
-
 
 class DesignSystem:
-    def __init__(self, root_path: str, cdn: str):
+    def __init__(self, root_path: str, cdn: str, date_source: str = "mtime"):
         self.root_path = root_path
-        self.artifacts = {
-            "component": "components",
-            "style": "styles",
-            "theme": "themes",
-            "variable": "variables",
-            "example": "examples",
-            "library": "libraries",
-        }
+        self.date_source = date_source
+        self.artifacts = ARTIFACTS
+        self.index = SourceIndex.get(root_path)
         data = self._get_full_definition()
         if not cdn:
             cdn = "/".join([DEFAULT_CDN_ROOT.rstrip("/"), data["id"]])
         self.cdn = cdn
-        self.data = self._add_cdn_url(data)
+        self.data = self._transform(data)
 
     def getData(self) -> dict[str, Any]:
         """Get design system full definition with artefacts"""
@@ -41,29 +29,29 @@ class DesignSystem:
 
     def _get_full_definition(self) -> dict[str, Any]:
         data = self._load_main_file()
+        # Files are parsed concurrently, but merged in this order.
+        loaders: list[tuple[str, Callable[..., dict[str, Any]]]] = []
         for artifact in self.artifacts:
+            paths = self.index.artifacts[artifact]
             # Examples:
             # - color.style.yml
             # - examples/album.example.yml
             # - components/card/card.component.yml
-            pattern = os.path.join(self.root_path, "**", "*." + artifact + ".yml")
-            for path in glob.glob(pattern, recursive=True):
-                data = self._load_file_with_single_item(path, data)
+            for path in paths["single"]:
+                loaders.append((path, self._load_file_with_single_item))
             # Examples:
             # - styles.yml
             # - libraries.yml
-            plural = self.artifacts[artifact]
-            pattern = os.path.join(self.root_path, "**", plural + ".yml")
-            for path in glob.glob(pattern, recursive=True):
-                data = self._load_file_with_multiple_items(path, data)
+            for path in paths["plural"]:
+                loaders.append((path, self._load_file_with_multiple_items))
             # Examples:
             # - colors.styles.yml
             # - whatever/background.variables.yml
-            pattern = os.path.join(self.root_path, "**", "*." + plural + ".yml")
-            for path in glob.glob(pattern, recursive=True):
-                data = self._load_file_with_multiple_items(path, data)
-        data = self._fix_integer_keys(data)
-        data = self._add_missing_component_id_to_examples(data)
+            for path in paths["suffixed"]:
+                loaders.append((path, self._load_file_with_multiple_items))
+        contents = YamlLoader.load_many([path for path, loader in loaders])
+        for (path, loader), content in zip(loaders, contents):
+            data = loader(path, content, data)
         data = self._add_the_date(data)
         # TODO: extends mechanism
         return data
@@ -75,75 +63,86 @@ class DesignSystem:
             path = "/" + path.lstrip("/")
         return path
 
-    def _fix_integer_keys(self, data: dict[str, Any]) -> dict[str, Any]:
-        new = {}
-        for key, value in data.items():
-            if isinstance(value, dict):
-                value = self._fix_integer_keys(value)
-            new[str(key)] = value
-        return new
-
     def _add_the_date(self, data: dict[str, Any]) -> dict[str, Any]:
         if "dateModified" not in data.keys():
-            data["dateModified"] = self._get_last_modification(self.root_path)
+            data["dateModified"] = self.index.last_modification(self.date_source)
         return data
 
-    def _get_last_modification(self, path: str) -> int:
-        date = 0
-        for root, dirs, files in os.walk(path):
-            for name in files:
-                filepath = os.path.join(root, name)
-                if ".git" in filepath:
+    def _transform(self, data: dict[str, Any]) -> dict[str, Any]:
+        # A single iterative pass, editing in place:
+        # - keys of every mapping are strings, YAML allows integers
+        # - components examples get their @component
+        # - images paths in renderables get the CDN
+        # Nodes shared by YAML aliases are visited once.
+        visited: set[int] = set()
+        # Dicts or lists, and whether they are part of a renderable.
+        stack: list[tuple[Any, bool]] = []
+        for renderable in self._get_renderables(data):
+            visited.add(id(renderable))
+            stack.append((renderable, True))
+        stack.append((data, False))
+        while stack:
+            node, is_renderable = stack.pop()
+            if isinstance(node, dict):
+                if not all(isinstance(key, str) for key in node):
+                    items = list(node.items())
+                    node.clear()
+                    node.update((str(key), value) for key, value in items)
+                children: Iterable[tuple[Any, Any]] = node.items()
+            else:
+                children = enumerate(node)
+            for key, value in children:
+                if isinstance(value, str):
+                    if is_renderable:
+                        node[key] = self._add_cdn_url_to_path(value, "")
                     continue
-                if os.stat(filepath)[stat.ST_MTIME] > date:
-                    date = int(os.stat(root)[stat.ST_MTIME])
-            for name in dirs:
-                dirpath = os.path.join(root, name)
-                if ".git" in filepath:
+                if not isinstance(value, (dict, list)) or id(value) in visited:
                     continue
-                if os.stat(dirpath)[stat.ST_MTIME] > date:
-                    date = int(os.stat(root)[stat.ST_MTIME])
-        return date
-
-    def _add_cdn_url(self, data: dict[str, Any]) -> dict[str, Any]:
+                visited.add(id(value))
+                stack.append((value, is_renderable))
         if "libraries" in data.keys():
-            for library_id, library in data["libraries"].items():
+            for library in data["libraries"].values():
                 path = library["_path"] if "_path" in library.keys() else ""
-                library = self._add_cdn_url_to_library(library, path)
-                data["libraries"][library_id] = library
-        if "examples" in data.keys():
-            for example_id, example in data["examples"].items():
-                path = example["_path"] if "_path" in example.keys() else ""
-                renderable = self._add_cdn_url_to_renderable(
-                    example["renderable"], path
-                )
-                data["examples"][example_id]["renderable"] = renderable
+                self._add_cdn_url_to_library(library, path)
         if "components" in data.keys():
-            for component_id, component in data["components"].items():
-                data["components"][component_id] = self._add_cdn_url_to_component(
-                    component
-                )
+            for component in data["components"].values():
+                path = component["_path"] if "_path" in component.keys() else ""
+                if "library" in component.keys():
+                    self._add_cdn_url_to_library(component["library"], path)
         return data
 
-    def _add_cdn_url_to_component(self, component: dict[str, Any]) -> dict[str, Any]:
-        path = component["_path"] if "_path" in component.keys() else ""
-        if "library" in component.keys():
-            library = self._add_cdn_url_to_library(component["library"], path)
-            component["library"] = library
-        if "examples" in component.keys():
-            for example_id, example in component["examples"].items():
-                renderable = self._add_cdn_url_to_renderable(
-                    example["renderable"], path
+    def _get_renderables(
+        self, data: dict[str, Any]
+    ) -> list[dict[str, Any] | list[Any]]:
+        examples = list(data.get("examples", {}).values())
+        for component_id, component in data.get("components", {}).items():
+            for example in component.get("examples", {}).values():
+                renderable = example.setdefault("renderable", {})
+                if "@component" not in renderable:
+                    # Kept first, like written by hand.
+                    items = list(renderable.items())
+                    renderable.clear()
+                    renderable["@component"] = str(component_id)
+                    renderable.update(items)
+                examples.append(example)
+        renderables = []
+        for example in examples:
+            if "renderable" not in example:
+                continue
+            if isinstance(example["renderable"], str):
+                example["renderable"] = self._add_cdn_url_to_path(
+                    example["renderable"], ""
                 )
-                component["examples"][example_id]["renderable"] = renderable
-        return component
+                continue
+            renderables.append(example["renderable"])
+        return renderables
 
     def _add_cdn_url_to_library(
         self, library: dict[str, Any], path: str
     ) -> dict[str, Any]:
         if "css" in library.keys():
             for url, attributes in library["css"].copy().items():
-                if validators.url(url):
+                if UrlClassifier.is_url(url):
                     continue
                 # Sometimes, validators miss complex URL like the google fonts
                 # ones.
@@ -157,7 +156,7 @@ class DesignSystem:
                 del library["css"][url]
         if "js" in library.keys():
             for url, attributes in library["js"].copy().items():
-                if validators.url(url):
+                if UrlClassifier.is_url(url):
                     continue
                 new_url = url
                 if not new_url.startswith("/"):
@@ -167,42 +166,20 @@ class DesignSystem:
                 del library["js"][url]
         return library
 
-    def _add_cdn_url_to_renderable(
-        self, data: dict[str, Any], path: str
-    ) -> dict[str, Any]:
-        if isinstance(data, list):
-            for index, item in enumerate(data):
-                data[index] = self._add_cdn_url_to_renderable(item, "")
-        if isinstance(data, dict):
-            for key, value in data.items():
-                data[key] = self._add_cdn_url_to_renderable(value, "")
-        if isinstance(data, str):
-            if " " in data:
-                return data
-            if validators.url(data):
-                return data
-            data = self._add_cdn_url_to_path(data, path)
-        return data
-
     def _add_cdn_url_to_path(self, data: str, path: str) -> str:
-        for extension in ["jpg", "png", "jpeg", "svg"]:
-            if not data.endswith("." + extension):
-                continue
-            if not data.startswith("/"):
-                continue
-                # Previously data = os.path.join(path, data) but this
-                # situation has not been encountered yet.
-            data = "/".join([self.cdn.rstrip("/"), data.lstrip("/")])
+        # Relative paths are left untouched. Previously they were joined to
+        # the path, but this situation has not been encountered yet.
+        if not UrlClassifier.is_image_path(data):
             return data
-        return data
+        return "/".join([self.cdn.rstrip("/"), data.lstrip("/")])
 
     def _load_main_file(self) -> dict[str, Any]:
-        with open(self.root_path + "/info.yml") as file:
-            return dict(yaml.load(file, Loader=SafeLoader))
-        return {}
+        data = dict(YamlLoader.load(self.root_path + "/info.yml"))
+        data.pop(CONFIG_KEY, None)
+        return data
 
     def _load_file_with_multiple_items(
-        self, path: str, data: dict[str, Any]
+        self, path: str, items: dict[str, Any], data: dict[str, Any]
     ) -> dict[str, Any]:
         filename = os.path.basename(path)
         _path = self._resolve_path(path)
@@ -213,15 +190,13 @@ class DesignSystem:
             artifact_plural, extension = parts
         if not artifact_plural:
             return data
-        with open(path) as file:
-            if artifact_plural not in data.keys():
-                data[artifact_plural] = {}
-            items = yaml.load(file, Loader=SafeLoader)
-            for item_id, item in items.items():
-                item = self._add_missing_ids(item_id, artifact_plural, item)
-                if _path:
-                    item["_path"] = _path
-                data[artifact_plural][item_id] = item
+        if artifact_plural not in data.keys():
+            data[artifact_plural] = {}
+        for item_id, item in items.items():
+            item = self._add_missing_ids(item_id, artifact_plural, item)
+            if _path:
+                item["_path"] = _path
+            data[artifact_plural][item_id] = item
         return data
 
     def _add_missing_ids(
@@ -251,39 +226,19 @@ class DesignSystem:
             data["library"]["id"] = item_id
         return data
 
-    def _add_missing_component_id_to_examples(
-        self, data: dict[str, Any]
-    ) -> dict[str, Any]:
-        if "components" not in data.keys():
-            return data
-        for component_id, component in data["components"].items():
-            if "examples" not in component.keys():
-                continue
-            for example_id, example in component["examples"].items():
-                renderable = (
-                    example["renderable"] if "renderable" in example.keys() else {}
-                )
-                renderable = {"@component": component_id} | renderable
-                data["components"][component_id]["examples"][example_id][
-                    "renderable"
-                ] = renderable
-        return data
-
     def _load_file_with_single_item(
-        self, path: str, data: dict[str, Any]
+        self, path: str, item: dict[str, Any], data: dict[str, Any]
     ) -> dict[str, Any]:
         filename = os.path.basename(path)
         _path = self._resolve_path(path)
         item_id, artifact, extension = filename.split(".")
         plural = self.artifacts[artifact]
-        with open(path) as file:
-            if plural not in data.keys():
-                data[plural] = {}
-            item = yaml.load(file, Loader=SafeLoader)
-            item = self._add_missing_ids(item_id, plural, item)
-            if _path:
-                item["_path"] = _path
-            data[plural][item_id] = item
+        if plural not in data.keys():
+            data[plural] = {}
+        item = self._add_missing_ids(item_id, plural, item)
+        if _path:
+            item["_path"] = _path
+        data[plural][item_id] = item
         return data
 
     @staticmethod
@@ -297,8 +252,7 @@ class DesignSystem:
             options = options | style_options
         return sorted(options)
 
-    def export(self, target_path: str) -> None:
+    def export(self, target_path: str, compact: bool = False) -> None:
         """Export full design system definition in a single JSON file"""
-        content = json.dumps(self.data, indent=4, ensure_ascii=False)
         path = os.path.join(target_path, "definitions.json")
-        FileSystemManager.write_file(path, content)
+        FileSystemManager.write_json(path, self.data, compact)
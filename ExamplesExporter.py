@@ -7,32 +7,57 @@ from typing import Any
 
 
 class ExamplesExporter:
-    def export(self, data: dict[str, Any], target_path: str) -> None:
+    def export(
+        self,
+        data: dict[str, Any],
+        target_path: str,
+        compact: bool = False,
+        examples_format: str = "files",
+    ) -> None:
         """Export examples and component examples to JSON files"""
-        self._export_examples(data, target_path)
-        self._export_components_examples(data, target_path)
+        examples = self._get_examples(data) | self._get_components_examples(data)
+        if examples_format == "bundle":
+            self._export_bundle(examples, target_path)
+            return
+        files = {
+            os.path.join(target_path, key + ".json"): renderable
+            for key, renderable in examples.items()
+        }
+        FileSystemManager.write_json_many(files, compact)
+
+    def _export_bundle(self, examples: dict[str, Any], target_path: str) -> None:
+        index = {}
+        lines = []
+        offset = 0
+        for key, renderable in examples.items():
+            line = json.dumps(
+                renderable, separators=(",", ":"), ensure_ascii=False
+            ).encode()
+            index[key] = [offset, len(line)]
+            lines.append(line + b"\n")
+            offset += len(line) + 1
+        FileSystemManager.write_bytes(
+            os.path.join(target_path, "examples.ndjson"), b"".join(lines)
+        )
+        FileSystemManager.write_json(
+            os.path.join(target_path, "examples.index.json"), index, True
+        )
 
-    def _export_examples(self, data: dict[str, Any], target_path: str) -> None:
+    def _get_examples(self, data: dict[str, Any]) -> dict[str, Any]:
+        examples: dict[str, Any] = {}
         if "examples" not in data:
-            return
+            return examples
         for example_id, example in data["examples"].items():
             if "renderable" not in example:
                 continue
             renderable = example["renderable"]
             if renderable is list and len(renderable) == 1:
                 renderable = renderable[0]
-            parts = [
-                target_path,
-                "examples",
-                example_id + ".json",
-            ]
-            path = os.path.join(*parts)
-            content = json.dumps(renderable, indent=4, ensure_ascii=False)
-            FileSystemManager.write_file(path, content)
+            examples["examples/" + example_id] = renderable
+        return examples
 
-    def _export_components_examples(
-        self, data: dict[str, Any], target_path: str
-    ) -> None:
+    def _get_components_examples(self, data: dict[str, Any]) -> dict[str, Any]:
+        examples: dict[str, Any] = {}
         for component_id, component in data["components"].items():
             if "examples" not in component:
                 continue
@@ -42,11 +67,5 @@ class ExamplesExporter:
                 renderable = example["renderable"]
                 if renderable is list and len(renderable) == 1:
                     renderable = renderable[0]
-                parts = [
-                    target_path,
-                    "tests",
-                    component_id + "--" + example_id + ".json",
-                ]
-                path = os.path.join(*parts)
-                content = json.dumps(renderable, indent=4, ensure_ascii=False)
-                FileSystemManager.write_file(path, content)
+                examples["tests/" + component_id + "--" + example_id] = renderable
+        return examples
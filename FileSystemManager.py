@@ -1,15 +1,39 @@
 #!/usr/bin/env python3
 
 import os
-import sys
+import json
+import errno
+import fcntl
 import shutil
+import filecmp
 import logging
-import coloredlogs
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Iterator
 
-coloredlogs.install(level="INFO", stream=sys.stdout)
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+# How static files are published:
+# - copy: a full copy of each file
+# - reflink: a copy on write clone sharing the blocks of the source, when the
+#   filesystem supports it (Btrfs, XFS...), a regular copy otherwise
+# - hardlink: the same file as the source, a copy across filesystems
+PUBLISH_METHODS = ["copy", "reflink", "hardlink"]
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+# Writes are mostly waiting for I/O, but too many threads thrash the disk.
+IO_THREADS = min(32, (os.cpu_count() or 1) + 4)
 
 
 class FileSystemManager:
+    _tracked: list[list[str]] = []
+
     @staticmethod
     def prepare_target(target_path: str) -> None:
         """Prepare target path by deleting existing content"""
@@ -18,22 +42,245 @@ class FileSystemManager:
             shutil.rmtree(target_path)
         os.makedirs(target_path, exist_ok=True)
 
+    @staticmethod
+    @contextmanager
+    def track() -> Iterator[list[str]]:
+        """Collect paths of the files written or copied inside the context"""
+        paths: list[str] = []
+        FileSystemManager._tracked.append(paths)
+        try:
+            yield paths
+        finally:
+            # Nested contexts can collect equal lists, remove this very one.
+            FileSystemManager._tracked = [
+                tracked
+                for tracked in FileSystemManager._tracked
+                if tracked is not paths
+            ]
+
+    @staticmethod
+    def _track(path: str) -> None:
+        for paths in FileSystemManager._tracked:
+            paths.append(path)
+
     @staticmethod
     def write_file(path: str, content: str) -> None:
-        """Create missing folders and write file"""
+        """Create missing folders and write file, unless it has the same content"""
+        FileSystemManager.write_bytes(path, content.encode())
+
+    @staticmethod
+    def write_bytes(path: str, data: bytes) -> None:
+        """Create missing folders and write binary file, unless it has the same content"""
+        FileSystemManager._track(path)
+        if os.path.exists(path) and os.path.getsize(path) == len(data):
+            with open(path, "rb") as file:
+                if file.read() == data:
+                    return
+        dir = os.path.dirname(path)
+        if not os.path.exists(dir):
+            os.makedirs(dir, exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+
+    @staticmethod
+    def write_json(
+        path: str,
+        data: Any,
+        compact: bool = False,
+        cls: type[json.JSONEncoder] | None = None,
+    ) -> None:
+        """Serialize data straight to a JSON file, unless it has the same content"""
         dir = os.path.dirname(path)
         if not os.path.exists(dir):
             os.makedirs(dir, exist_ok=True)
-        with open(path, "w") as file:
+        FileSystemManager._write_json(path, data, compact, cls)
+
+    @staticmethod
+    def write_json_many(
+        files: dict[str, Any],
+        compact: bool = False,
+        cls: type[json.JSONEncoder] | None = None,
+    ) -> None:
+        """Serialize data to many JSON files on a pool of threads"""
+        for folder in {os.path.dirname(path) for path in files}:
+            os.makedirs(folder, exist_ok=True)
+        if len(files) < 2:
+            for path, data in files.items():
+                FileSystemManager._write_json(path, data, compact, cls)
+            return
+        with ThreadPoolExecutor(max_workers=IO_THREADS) as executor:
+            # Consume results to raise the first failure.
+            list(
+                executor.map(
+                    lambda path, data: FileSystemManager._write_json(
+                        path, data, compact, cls
+                    ),
+                    files.keys(),
+                    files.values(),
+                )
+            )
+
+    @staticmethod
+    def _write_json(
+        path: str, data: Any, compact: bool, cls: type[json.JSONEncoder] | None
+    ) -> None:
+        FileSystemManager._track(path)
+        temporary_path = "%s.%d.%d" % (path, os.getpid(), threading.get_ident())
+        try:
+            if compact and orjson:
+                FileSystemManager._write_orjson(temporary_path, data, cls)
+            else:
+                with open(temporary_path, "w", encoding="utf-8") as file:
+                    json.dump(
+                        data,
+                        file,
+                        indent=None if compact else 4,
+                        separators=(",", ":") if compact else None,
+                        ensure_ascii=False,
+                        cls=cls,
+                    )
+            if os.path.exists(path) and filecmp.cmp(temporary_path, path, False):
+                os.remove(temporary_path)
+                return
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    @staticmethod
+    def _write_orjson(path: str, data: Any, cls: type[json.JSONEncoder] | None) -> None:
+        default = cls().default if cls else None
+        try:
+            content = orjson.dumps(
+                data, default=default, option=orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            # Like integers too big for orjson.
+            content = json.dumps(
+                data, separators=(",", ":"), ensure_ascii=False, cls=cls
+            ).encode()
+        with open(path, "wb") as file:
             file.write(content)
 
     @staticmethod
     def copy_file(source_path: str, target_path: str) -> None:
-        """Create missing folders and copy file to new path"""
+        """Create missing folders and copy file to new path, unless identical"""
+        FileSystemManager._track(target_path)
+        if os.path.exists(target_path) and filecmp.cmp(source_path, target_path):
+            return
         target_dir = os.path.dirname(target_path)
         if not os.path.exists(target_dir):
             os.makedirs(target_dir, exist_ok=True)
-        shutil.copyfile(source_path, target_path)
+        shutil.copy2(source_path, target_path)
+
+    @staticmethod
+    def publish(files: dict[str, str], target_path: str, method: str = "copy") -> None:
+        """Sync source files to their target paths, and delete the other files"""
+        for path in files.values():
+            FileSystemManager._track(path)
+        os.makedirs(target_path, exist_ok=True)
+        FileSystemManager._prune_target(target_path, set(files.values()))
+        pending = [
+            (source, target)
+            for source, target in files.items()
+            if not FileSystemManager._is_published(source, target, method)
+        ]
+        for folder in {os.path.dirname(target) for _, target in pending}:
+            os.makedirs(folder, exist_ok=True)
+        if len(pending) < 2:
+            for source, target in pending:
+                FileSystemManager._publish_file(source, target, method)
+            return
+        with ThreadPoolExecutor(max_workers=IO_THREADS) as executor:
+            # Consume results to raise the first failure.
+            list(
+                executor.map(
+                    lambda source, target: FileSystemManager._publish_file(
+                        source, target, method
+                    ),
+                    [source for source, _ in pending],
+                    [target for _, target in pending],
+                )
+            )
+
+    @staticmethod
+    def _is_published(source_path: str, target_path: str, method: str) -> bool:
+        # Copies keep the modification time of their source.
+        try:
+            target = os.stat(target_path)
+        except FileNotFoundError:
+            return False
+        source = os.stat(source_path)
+        if source.st_ino == target.st_ino and source.st_dev == target.st_dev:
+            # A hardlink left by a previous run must be split from the source.
+            return method == "hardlink"
+        return (
+            source.st_size == target.st_size
+            and source.st_mtime_ns == target.st_mtime_ns
+        )
+
+    @staticmethod
+    def _publish_file(source_path: str, target_path: str, method: str) -> None:
+        # Replace instead of overwriting, a hardlinked target is the source.
+        temporary_path = "%s.%d.%d" % (target_path, os.getpid(), threading.get_ident())
+        try:
+            if method == "hardlink":
+                try:
+                    os.link(source_path, temporary_path)
+                    os.replace(temporary_path, target_path)
+                    return
+                except OSError:
+                    pass
+            if method == "reflink":
+                FileSystemManager._clone_file(source_path, temporary_path)
+            else:
+                shutil.copyfile(source_path, temporary_path)
+            shutil.copystat(source_path, temporary_path)
+            os.replace(temporary_path, target_path)
+        except BaseException:
+            if os.path.lexists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    @staticmethod
+    def _clone_file(source_path: str, target_path: str) -> None:
+        with open(source_path, "rb") as source, open(target_path, "wb") as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                return
+            except OSError:
+                pass
+            # In kernel copy, also cloning on some filesystems like NFS 4.2.
+            size = os.fstat(source.fileno()).st_size
+            copied = 0
+            try:
+                while copied < size:
+                    count = os.copy_file_range(
+                        source.fileno(), target.fileno(), size - copied
+                    )
+                    if not count:
+                        break
+                    copied += count
+            except OSError as error:
+                if error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                    raise
+            source.seek(copied)
+            target.seek(copied)
+            shutil.copyfileobj(source, target)
+
+    @staticmethod
+    def _prune_target(target_path: str, paths: set[str]) -> None:
+        if not os.path.isdir(target_path):
+            return
+        for folder, _, filenames in os.walk(target_path, topdown=False):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                if path not in paths:
+                    logging.info("PRUNE %s", path)
+                    os.remove(path)
+            if folder != target_path and not os.listdir(folder):
+                os.rmdir(folder)
 
     @staticmethod
     def copy_directory(source_path: str, target_path: str) -> None:
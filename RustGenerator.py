@@ -1,45 +1,95 @@
 #!/usr/bin/env python3
 
 import os
-from jinja2 import Environment, FileSystemLoader
-import glob
+import copy
+import functools
+from types import MappingProxyType
 from DesignSystem import DesignSystem
+from SourceIndex import SourceIndex
 from FileSystemManager import FileSystemManager
-from typing import Any
+from BuildOptions import RUST_TEMPLATES
+from typing import TYPE_CHECKING, Any, Mapping, NamedTuple
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(__file__), "templates")
+
+# Compiled templates, written when the Docker image is built, so containers
+# only load them.
+BYTECODE_CACHE_PATH = os.path.join(TEMPLATES_PATH, ".bytecode")
+
+
+class LibraryModel(NamedTuple):
+    """Libraries and components libraries, sorted out for the Rust file"""
+
+    # Read-only copies, so generators cannot change the definition through them.
+    # Flat url / attributes maps of all default libraries.
+    default_css: Mapping[str, Any]
+    default_js: Mapping[str, Any]
+    # Maps where keys are libraries ID, and values are url / attributes maps.
+    other_ids: tuple[str, ...]
+    other_css: Mapping[str, Any]
+    other_js: Mapping[str, Any]
+    # Maps where keys are components ID.
+    components: Mapping[str, Any]
+    components_css: Mapping[str, Any]
+    components_js: Mapping[str, Any]
+    components_dependencies: Mapping[str, Any]
+
+
+@functools.cache
+def get_environment() -> "Environment":
+    """Get the Jinja environment shared by every generator of the process"""
+    # Loaded with the first template, commands like data never need it.
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    bytecode_cache = None
+    # Read only when the image is run with -u, but filled at build time.
+    if os.path.isdir(BYTECODE_CACHE_PATH) or os.access(TEMPLATES_PATH, os.W_OK):
+        os.makedirs(BYTECODE_CACHE_PATH, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(BYTECODE_CACHE_PATH)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_PATH),
+        bytecode_cache=bytecode_cache,
+        # Templates never change while running, do not check them again.
+        auto_reload=False,
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
 
 
 class RustGenerator:
-    def __init__(self) -> None:
-        basepath = os.path.dirname(__file__)
-        basepath = os.path.join(basepath, "templates/")
-        env = Environment(loader=FileSystemLoader(basepath))
-        self.template = env.get_template("rust.jinja")
+    def __init__(self, mode: str = "runtime") -> None:
+        # Compiled once, then cached by the environment.
+        self.template = get_environment().get_template(RUST_TEMPLATES[mode])
+
+    @staticmethod
+    def compile_templates() -> None:
+        """Fill the bytecode cache with every template"""
+        for name in RUST_TEMPLATES.values():
+            get_environment().get_template(name)
 
     def _prepare_data(
         self, source_data: dict[str, Any], source_path: str
     ) -> dict[str, Any]:
         data = {}
+        libraries = self._classifyLibraries(source_data)
         data["design_system"] = source_data["id"]
-        data["components_library_css_html"] = self._renderComponentsLibrariesCss(
-            source_data
+        data["components_library_css_html"] = self._renderLinksById(
+            libraries.components_css
         )
-        data[
-            "components_library_dependencies"
-        ] = self._getComponentsLibraryDependencies(source_data)
-        data["components_library_js"] = self._getComponentsLibrariesJs(source_data)
+        data["components_library_dependencies"] = libraries.components_dependencies
+        data["components_library_js"] = libraries.components_js
         data["components_variant_template"] = self._getVariantsWithTemplates(
             source_data, source_path
         )
-        data["components_with_library"] = self._getComponentsWithLibrary(
-            source_data
-        ).keys()
-        data["default_libraries_css_html"] = self._renderDefaultLibrariesCss(
-            source_data
-        )
-        data["default_libraries_js"] = self._getDefaultLibrariesJs(source_data)
-        data["libraries_css_html"] = self._renderOtherLibrariesCss(source_data)
-        data["libraries_js"] = self._getOtherLibrariesJs(source_data)
-        data["libraries_keys"] = self._getOtherLibrariesDefinitions(source_data).keys()
+        data["components_with_library"] = libraries.components.keys()
+        data["default_libraries_css_html"] = self._renderCssLinks(libraries.default_css)
+        data["default_libraries_js"] = libraries.default_js
+        data["libraries_css_html"] = self._renderLinksById(libraries.other_css)
+        data["libraries_js"] = libraries.other_js
+        data["libraries_keys"] = libraries.other_ids
         data["styles"] = DesignSystem.merge_styles_options(source_data)
         data["variables"] = self._getVariablesDefaultValues(source_data)
         data["themes"] = self._getThemes(source_data)
@@ -61,171 +111,114 @@ class RustGenerator:
             }
         return definitions
 
-    def _getDefaultLibrariesDefinitions(self, data: dict[str, Any]) -> dict[str, Any]:
-        definitions = {}
-        if "libraries" not in data.keys():
-            return {}
-        for library_id, library in data["libraries"].items():
-            if "default" not in library.keys():
-                continue
-            if not library["default"]:
-                continue
-            definitions[library_id] = library
-        return definitions
-
-    # A flat list of links because all default libraries mixed together.
-    def _getDefaultLibrariesCss(self, data: dict[str, Any]) -> dict[str, Any]:
-        links: dict[str, dict[str, Any]] = {}
-        for library_id, library in self._getDefaultLibrariesDefinitions(data).items():
-            if "css" not in library.keys():
-                continue
-            links = links | library["css"]
-        return links
-
-    def _getDefaultLibrariesJs(self, data: dict[str, Any]) -> dict[str, Any]:
-        links: dict[str, dict[str, Any]] = {}
-        for library_id, library in self._getDefaultLibrariesDefinitions(data).items():
-            if "js" not in library.keys():
-                continue
-            links = links | library["js"]
-        return links
-
-    # A single string  because all default libraries mixed together.
-    def _renderDefaultLibrariesCss(self, data: dict[str, Any]) -> str:
-        markup = ""
-        for url, attributes in self._getDefaultLibrariesCss(data).items():
-            attributes["href"] = url
-            attributes["rel"] = "stylesheet"
-            attributes["type"] = "text/css"
-            markup += "<link" + self.renderAttributes(attributes) + ">\n"
-        return markup
-
-    def _getOtherLibrariesDefinitions(self, data: dict[str, Any]) -> dict[str, Any]:
-        definitions = {}
-        if "libraries" not in data.keys():
-            return {}
-        for library_id, library in data["libraries"].items():
-            if "default" not in library.keys():
-                definitions[library_id] = library
-                continue
-            if not library["default"]:
-                definitions[library_id] = library
-        return definitions
-
-    def _getOtherLibrariesCss(self, data: dict[str, Any]) -> dict[str, Any]:
-        libraries = {}
-        for library_id, library in self._getOtherLibrariesDefinitions(data).items():
-            if "css" not in library.keys():
-                continue
-            libraries[library_id] = library["css"]
-        return libraries
-
-    def _getOtherLibrariesJs(self, data: dict[str, Any]) -> dict[str, Any]:
-        libraries = {}
-        for library_id, library in self._getOtherLibrariesDefinitions(data).items():
-            if "js" not in library.keys():
-                continue
-            libraries[library_id] = library["js"]
-        return libraries
+    def _classifyLibraries(self, data: dict[str, Any]) -> LibraryModel:
+        # A single pass over libraries and components.
+        default_css: dict[str, Any] = {}
+        default_js: dict[str, Any] = {}
+        other_ids = []
+        other_css = {}
+        other_js = {}
+        for library_id, library in data.get("libraries", {}).items():
+            if library.get("default"):
+                # Flat maps, because all default libraries are mixed together.
+                default_css.update(library.get("css", {}))
+                default_js.update(library.get("js", {}))
+                continue
+            other_ids.append(library_id)
+            if "css" in library.keys():
+                other_css[library_id] = library["css"]
+            if "js" in library.keys():
+                other_js[library_id] = library["js"]
+        components = {}
+        components_css = {}
+        components_js = {}
+        components_dependencies = {}
+        for component_id, component in data.get("components", {}).items():
+            library = component.get("library")
+            if not library:
+                continue
+            components[component_id] = library
+            if library.get("css"):
+                components_css[component_id] = library["css"]
+            if library.get("js"):
+                components_js[component_id] = library["js"]
+            if library.get("dependencies"):
+                components_dependencies[component_id] = library["dependencies"]
+        freeze = RustGenerator._freeze
+        return LibraryModel(
+            default_css=freeze(default_css, 2),
+            default_js=freeze(default_js, 2),
+            other_ids=tuple(other_ids),
+            other_css=freeze(other_css, 3),
+            other_js=freeze(other_js, 3),
+            components=freeze(components, 1),
+            components_css=freeze(components_css, 3),
+            components_js=freeze(components_js, 3),
+            components_dependencies=freeze(components_dependencies, 1),
+        )
 
-    # A map where keys are libraries ID, and values are rendered markup.
-    def _renderOtherLibrariesCss(self, data: dict[str, Any]) -> dict[str, Any]:
+    @staticmethod
+    def _freeze(value: Any, depth: int) -> Any:
+        # Mappings down to the attributes are read-only, values below are
+        # copied, so attribute values keep their type when rendered.
+        if depth and isinstance(value, Mapping):
+            return MappingProxyType(
+                {
+                    key: RustGenerator._freeze(item, depth - 1)
+                    for key, item in value.items()
+                }
+            )
+        return copy.deepcopy(value)
+
+    # A map where keys are libraries or components ID, and values are markup.
+    def _renderLinksById(self, libraries: Mapping[str, Any]) -> dict[str, str]:
         markups = {}
-        for library_id, library in self._getOtherLibrariesCss(data).items():
-            markup = ""
-            for url, attributes in library.items():
-                attributes["href"] = url
-                attributes["rel"] = "stylesheet"
-                attributes["type"] = "text/css"
-                markup += "<link" + self.renderAttributes(attributes) + ">\n"
+        for library_id, links in libraries.items():
+            markup = self._renderCssLinks(links)
             if len(markup) == 0:
                 continue
             markups[library_id] = markup
         return markups
 
-    # A map where keys are components ID, and values are rendered markup.
-    def _renderComponentsLibrariesCss(self, data: dict[str, Any]) -> dict[str, Any]:
-        markups = {}
-        for component_id, library in self._getComponentsLibrariesCss(data).items():
-            markup = ""
-            for url, attributes in library.items():
-                attributes["href"] = url
-                attributes["rel"] = "stylesheet"
-                attributes["type"] = "text/css"
-                markup += "<link" + self.renderAttributes(attributes) + ">\n"
-            if len(markup) == 0:
-                continue
-            markups[component_id] = markup
-        return markups
+    def _renderCssLinks(self, links: Mapping[str, Any]) -> str:
+        # The definition is left untouched, the link attributes are added to
+        # a new mapping.
+        return "".join(
+            [
+                "<link"
+                + self.renderAttributes(
+                    {
+                        **attributes,
+                        "href": url,
+                        "rel": "stylesheet",
+                        "type": "text/css",
+                    }
+                )
+                + ">\n"
+                for url, attributes in links.items()
+            ]
+        )
 
     def renderAttributes(self, attributes: dict[str, Any]) -> str:
         """Render attributes mapping as HTML string"""
-        markup = ""
+        markup = []
         for key, value in attributes.items():
             if type(value) not in (dict, tuple, list):
-                markup += " " + key + '="' + str(value) + '"'
+                markup.append(' %s="%s"' % (key, value))
             if isinstance(value, list):
-                markup += " " + key + '="' + " ".join(value) + '"'
-        return markup
-
-    # A map where keys are components ID, and values are url / attributes maps.
-    def _getComponentsLibraryDependencies(self, data: dict[str, Any]) -> dict[str, Any]:
-        libraries = {}
-        for component_id, library in self._getComponentsWithLibrary(data).items():
-            if "dependencies" not in library.keys():
-                continue
-            if not library["dependencies"]:
-                continue
-            libraries[component_id] = library["dependencies"]
-        return libraries
-
-    def _getComponentsWithLibrary(self, data: dict[str, Any]) -> dict[str, Any]:
-        components = {}
-        if "components" not in data.keys():
-            return {}
-        for component_id, component in data["components"].items():
-            if "library" not in component.keys():
-                continue
-            if not component["library"]:
-                continue
-            components[component_id] = component["library"]
-        return components
-
-    # A map where keys are components ID, and values are url / attributes maps.
-    def _getComponentsLibrariesJs(self, data: dict[str, Any]) -> dict[str, Any]:
-        libraries = {}
-        for component_id, library in self._getComponentsWithLibrary(data).items():
-            if "js" not in library.keys():
-                continue
-            if not library["js"]:
-                continue
-            libraries[component_id] = library["js"]
-        return libraries
-
-    # A map where keys are components ID, and values are url / attributes maps.
-    def _getComponentsLibrariesCss(self, data: dict[str, Any]) -> dict[str, Any]:
-        libraries = {}
-        for component_id, library in self._getComponentsWithLibrary(data).items():
-            if "css" not in library.keys():
-                continue
-            if not library["css"]:
-                continue
-            libraries[component_id] = library["css"]
-        return libraries
+                markup.append(' %s="%s"' % (key, " ".join(value)))
+        return "".join(markup)
 
     def _getVariantsWithTemplates(
         self, data: dict[str, Any], source_path: str
     ) -> dict[str, Any]:
-        SEPARATOR = "."
         variants = {}
+        index = SourceIndex.get(source_path)
         for component_id, component in data["components"].items():
             if "variants" not in component.keys():
                 continue
             for variant_id in component["variants"].keys():
-                filename = component_id + SEPARATOR + variant_id + ".jinja"
-                pattern = source_path + "/components/**/" + filename
-                paths = glob.glob(pattern, recursive=True)
-                if not paths:
+                if not index.variant_template(component_id, variant_id):
                     continue
                 if component_id not in variants:
                     variants[component_id] = [variant_id]
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 
-import validators
 import os
+import time
 import json
-import requests
+import pickle
+import hashlib
+import logging
 import mergedeep
 from DesignSystem import DesignSystem
+from UrlClassifier import UrlClassifier
 from FileSystemManager import FileSystemManager
 from typing import Any
 
@@ -13,6 +16,11 @@ GENERIC_SCHEMA_PATH = (
     "https://gitlab.com/dilla-io/schemas/-/raw/master/renderable.schema.json"
 )
 
+# Copy of the generic schema fetched when the Docker image is built.
+BUNDLED_SCHEMA_PATH = os.path.join(
+    os.path.dirname(__file__), "schemas", "renderable.schema.json"
+)
+
 
 class SetEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -22,22 +30,135 @@ class SetEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+class ComponentSchemaBuilder:
+    def __init__(self, template: dict[str, Any]):
+        template = pickle.loads(pickle.dumps(template))
+        # Replaced by slots & props.
+        if "patternProperties" in template.keys():
+            del template["patternProperties"]
+        # Unpickling is much cheaper than a deep copy for each component.
+        self.template = pickle.dumps(template, protocol=pickle.HIGHEST_PROTOCOL)
+        self.props: dict[str, dict[str, Any]] = {}
+
+    def build(self, component_id: str, component: dict[str, Any]) -> dict[str, Any]:
+        """Build the schema of a component from a fresh copy of the template"""
+        component_schema: dict[str, Any] = pickle.loads(self.template)
+        properties = component_schema["properties"]
+        properties["@component"] = {
+            "const": component_id,
+        }
+        # Add variants enum.
+        if "variants" in component:
+            properties["@variant"]["enum"] = list(component["variants"].keys())
+        if "props" in component.keys():
+            for prop_id, prop in component["props"].items():
+                properties[prop_id] = self._get_prop_schema(prop["schema"])
+        if "slots" in component.keys():
+            for slot_id, slot in component["slots"].items():
+                properties[slot_id] = {"$ref": "#/$defs/slot_value"}
+        return component_schema
+
+    def _get_prop_schema(self, prop_schema: dict[str, Any]) -> dict[str, Any]:
+        # Identical prop schemas are copied once, and shared by components.
+        key = json.dumps(prop_schema, sort_keys=True, cls=SetEncoder)
+        if key not in self.props:
+            self.props[key] = pickle.loads(pickle.dumps(prop_schema))
+        return self.props[key]
+
+
 class SchemaGenerator:
-    def __init__(self, generic_schema: str):
-        self.generic_schema: dict[str, Any] = json.loads(generic_schema)
+    def __init__(self, generic_schema: dict[str, Any], mode: str = "conditional"):
+        # Generated schemas are built from a copy, so the generic schema can
+        # be parsed once and shared by every design system.
+        self.generic_schema = pickle.dumps(generic_schema)
+        self.mode = mode
 
     @staticmethod
-    def get_generic_schema() -> str:
-        """Get generic JSON schema"""
+    def load_generic_schema(
+        cache_dir: str = "", offline: bool = False
+    ) -> dict[str, Any]:
+        """Get and parse generic JSON schema"""
+        return dict(json.loads(SchemaGenerator.get_generic_schema(cache_dir, offline)))
+
+    @staticmethod
+    def get_generic_schema(cache_dir: str = "", offline: bool = False) -> str:
+        """Get generic JSON schema, from the cache when fresh or unreachable"""
         generic_schema_path = os.environ.get("SCHEMA", GENERIC_SCHEMA_PATH)
-        if validators.url(generic_schema_path):
-            return requests.get(generic_schema_path, timeout=5).text
-        with open(generic_schema_path) as file:
-            return file.read()
+        if not UrlClassifier.is_url(generic_schema_path):
+            with open(generic_schema_path) as file:
+                return file.read()
+        cache = SchemaGenerator._read_cached_schema(cache_dir, generic_schema_path)
+        ttl = int(os.environ.get("SCHEMA_TTL", 3600))
+        if cache and (offline or time.time() - cache["fetched"] < ttl):
+            return str(cache["content"])
+        if offline:
+            return SchemaGenerator._get_bundled_schema(generic_schema_path)
+        headers = {}
+        if cache and cache["etag"]:
+            headers["If-None-Match"] = cache["etag"]
+        if cache and cache["last_modified"]:
+            headers["If-Modified-Since"] = cache["last_modified"]
+        # Only loaded when the network is actually used.
+        import requests
+
+        try:
+            response = requests.get(generic_schema_path, headers=headers, timeout=5)
+            if cache and response.status_code == 304:
+                cache["fetched"] = time.time()
+                SchemaGenerator._write_cached_schema(cache_dir, cache)
+                return str(cache["content"])
+            response.raise_for_status()
+        except requests.RequestException as error:
+            logging.warning("Unable to fetch %s: %s", generic_schema_path, error)
+            if cache:
+                return str(cache["content"])
+            return SchemaGenerator._get_bundled_schema(generic_schema_path)
+        cache = {
+            "url": generic_schema_path,
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "fetched": time.time(),
+            "content": response.text,
+        }
+        SchemaGenerator._write_cached_schema(cache_dir, cache)
+        return response.text
+
+    @staticmethod
+    def _get_cache_path(cache_dir: str, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(cache_dir, "schema", key + ".json")
+
+    @staticmethod
+    def _read_cached_schema(cache_dir: str, url: str) -> dict[str, Any] | None:
+        if not cache_dir:
+            return None
+        try:
+            with open(SchemaGenerator._get_cache_path(cache_dir, url)) as file:
+                return dict(json.load(file))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_cached_schema(cache_dir: str, cache: dict[str, Any]) -> None:
+        if not cache_dir:
+            return
+        path = SchemaGenerator._get_cache_path(cache_dir, cache["url"])
+        FileSystemManager.write_file(path, json.dumps(cache))
+
+    @staticmethod
+    def _get_bundled_schema(url: str) -> str:
+        if not os.path.exists(BUNDLED_SCHEMA_PATH):
+            raise RuntimeError("No cached nor bundled copy of " + url)
+        logging.warning("Use the generic schema bundled in the image")
+        try:
+            with open(BUNDLED_SCHEMA_PATH) as file:
+                return file.read()
+        except OSError as error:
+            raise RuntimeError("No readable bundled copy of " + url) from error
 
     def generate(self, definition: dict[str, Any]) -> dict[str, Any]:
         """Generate a specific schema from design system definition and the generic schema"""
-        schema = self.generic_schema
+        schema: dict[str, Any] = pickle.loads(self.generic_schema)
         if "components" in definition.keys():
             schema = self._build_components_schema(definition, schema)
         if "styles" in definition.keys():
@@ -56,28 +177,15 @@ class SchemaGenerator:
         self, definition: dict[str, Any], schema: dict[str, Any]
     ) -> dict[str, Any]:
         refs = []
+        builder = ComponentSchemaBuilder(
+            self._clean(schema["$defs"]["component_renderable"])
+        )
         for component_id, component in definition["components"].items():
-            component_schema = schema["$defs"]["component_renderable"]
-            component_schema["properties"]["@component"] = {
-                "const": component_id,
-            }
-            # Add variants enum.
-            if "variants" in component:
-                component_schema["properties"]["@variant"]["enum"] = list(
-                    component["variants"].keys()
-                )
-            # Replace patternProperties with slots & props.
-            if "props" in component.keys():
-                for prop_id, prop in component["props"].items():
-                    component_schema["properties"][prop_id] = prop["schema"]
-            if "slots" in component.keys():
-                for slot_id, slot in component["slots"].items():
-                    component_schema["properties"][slot_id] = {
-                        "$ref": "#/$defs/slot_value"
-                    }
-            if "patternProperties" in component_schema.keys():
-                del component_schema["patternProperties"]
+            component_schema = builder.build(component_id, component)
             schema["$defs"]["component_renderable__" + component_id] = component_schema
+            if self.mode == "discriminator":
+                refs.append({"$ref": "#/$defs/component_renderable__" + component_id})
+                continue
             refs.append(
                 {
                     "if": {
@@ -89,6 +197,17 @@ class SchemaGenerator:
                     "else": False,
                 }
             )
+        if self.mode == "discriminator":
+            schema["$defs"]["component_renderable"] = {
+                "type": "object",
+                "required": ["@component"],
+                "properties": {
+                    "@component": {"enum": list(definition["components"].keys())},
+                },
+                "discriminator": {"propertyName": "@component"},
+                "oneOf": refs,
+            }
+            return schema
         schema["$defs"]["component_renderable"] = {
             "type": "object",
             "required": ["@component"],
@@ -145,8 +264,9 @@ class SchemaGenerator:
             del definition[prop]
         return definition
 
-    def export(self, data: dict[str, Any], target_path: str) -> None:
+    def export(
+        self, data: dict[str, Any], target_path: str, compact: bool = False
+    ) -> None:
         """Write JSON serialized data to  renderable.schema.json"""
         path = os.path.join(target_path, "renderable.schema.json")
-        content = json.dumps(data, indent=4, ensure_ascii=False, cls=SetEncoder)
-        FileSystemManager.write_file(path, content)
+        FileSystemManager.write_json(path, data, compact, cls=SetEncoder)
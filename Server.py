@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from BuildOptions import SCHEMA_MODES, RUST_TEMPLATES, EXAMPLES_FORMATS
+from FileSystemManager import PUBLISH_METHODS
+from SourceIndex import DATE_SOURCES
+from typing import Any, Callable
+
+# Build options a request can override, with their type.
+REQUEST_OPTIONS = {
+    "cdn": str,
+    "incremental": bool,
+    "schema_mode": str,
+    "compact": bool,
+    "rust_mode": str,
+    "snapshot": bool,
+    "examples_format": str,
+    "publish": str,
+    "date_source": str,
+    "profile": bool,
+}
+
+# Allowed values of the options, checked before the build purges anything.
+REQUEST_CHOICES = {
+    "schema_mode": SCHEMA_MODES,
+    "rust_mode": list(RUST_TEMPLATES.keys()),
+    "examples_format": EXAMPLES_FORMATS,
+    "publish": PUBLISH_METHODS,
+    "date_source": DATE_SOURCES,
+}
+
+REQUEST_STEPS = ["build", "data"]
+
+
+class BuildServer:
+    def __init__(
+        self,
+        source_root: str,
+        options: dict[str, Any],
+        load_generic_schema: Callable[[], dict[str, Any]],
+        build: Callable[..., dict[str, Any]],
+    ):
+        self.source_root = source_root.rstrip("/")
+        self.options = options
+        self.load_generic_schema = load_generic_schema
+        # Called like process_design_system(path, steps, options, schema, collect)
+        self.build = build
+        self.generic_schema = load_generic_schema()
+        self.schema_loaded = time.time()
+        # Builds share class level state, like tracked files, one at a time.
+        self.lock = threading.Lock()
+        self.builds = 0
+
+    def handle_build(self, request: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        """Build a design system, and get the HTTP status and response body"""
+        error = self._validate(request)
+        if error:
+            return 400, {"error": error}
+        source_path = os.path.abspath(request["source"])
+        options = self.options | {
+            key: value for key, value in request.items() if key in REQUEST_OPTIONS
+        }
+        steps = request.get("steps", REQUEST_STEPS)
+        with self.lock:
+            try:
+                # Kept in memory, but revalidated like the CLI would.
+                ttl = int(os.environ.get("SCHEMA_TTL", 3600))
+                if "build" in steps and time.time() - self.schema_loaded > ttl:
+                    self.generic_schema = self.load_generic_schema()
+                    self.schema_loaded = time.time()
+                result = self.build(
+                    os.path.join(source_path, "info.yml"),
+                    steps,
+                    options,
+                    self.generic_schema,
+                    True,
+                )
+            except Exception as error:
+                # Answer the client and keep serving the next builds.
+                logging.exception("%s failed", source_path)
+                return 500, {"error": str(error)}
+            self.builds += 1
+        for record in result["logs"]:
+            logging.getLogger().handle(record)
+        response = {key: value for key, value in result.items() if key != "logs"}
+        response["logs"] = [
+            record.levelname + " " + record.getMessage() for record in result["logs"]
+        ]
+        return (200 if result["success"] else 500), response
+
+    def handle_status(self) -> dict[str, Any]:
+        """Get the state of the server"""
+        return {"status": "ok", "builds": self.builds}
+
+    def _validate(self, request: Any) -> str:
+        if not isinstance(request, dict):
+            return "a JSON object is expected"
+        source = request.get("source")
+        if not isinstance(source, str):
+            return "source is required"
+        # Outputs are written to the same path in the output volume.
+        source_path = os.path.abspath(source)
+        if not source_path.startswith(self.source_root + "/"):
+            return "source must be inside " + self.source_root
+        if not os.path.isfile(os.path.join(source_path, "info.yml")):
+            return "no info.yml in " + source_path
+        for key, value in request.items():
+            if key in ("source", "steps"):
+                continue
+            if key not in REQUEST_OPTIONS:
+                return "unknown option %s" % key
+            if not isinstance(value, REQUEST_OPTIONS[key]):
+                return "%s must be a %s" % (key, REQUEST_OPTIONS[key].__name__)
+            if key in REQUEST_CHOICES and value not in REQUEST_CHOICES[key]:
+                return "%s must be one of: %s" % (key, ", ".join(REQUEST_CHOICES[key]))
+        steps = request.get("steps", REQUEST_STEPS)
+        if not isinstance(steps, list) or any(
+            step not in REQUEST_STEPS for step in steps
+        ):
+            return "steps must be a list among: " + ", ".join(REQUEST_STEPS)
+        return ""
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server: "HTTPServer"
+
+    def do_GET(self) -> None:
+        """Answer health checks"""
+        if self.path != "/status":
+            self._send(404, {"error": "not found"})
+            return
+        self._send(200, self.server.build_server.handle_status())
+
+    def do_POST(self) -> None:
+        """Run a build, described by a JSON body"""
+        if self.path != "/build":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "invalid JSON body"})
+            return
+        status, response = self.server.build_server.handle_build(request)
+        self._send(status, response)
+
+    def _send(self, status: int, body: dict[str, Any]) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self) -> str:
+        """Name the client, Unix sockets have no address"""
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Log requests with the other messages"""
+        logging.info("%s %s", self.address_string(), format % args)
+
+
+class HTTPServer(ThreadingHTTPServer):
+    build_server: BuildServer
+
+
+class UnixHTTPServer(HTTPServer):
+    address_family = socket.AF_UNIX
+
+    def __init__(self, path: str, handler: type[BaseHTTPRequestHandler]) -> None:
+        self.socket_path = path
+        # Typed for TCP addresses, a path is what AF_UNIX sockets expect.
+        super().__init__(path, handler)  # type: ignore[arg-type]
+
+    def server_bind(self) -> None:
+        """Bind the socket file, without the host lookup of TCP servers"""
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def create_server(listen: str, build_server: BuildServer) -> HTTPServer:
+    """Create a server on host:port, or on a Unix socket path"""
+    # Examples:
+    # - 127.0.0.1:8000
+    # - /run/prebuilder.sock
+    # - unix:/run/prebuilder.sock
+    if listen.startswith("unix:") or listen.startswith("/"):
+        server: HTTPServer = UnixHTTPServer(
+            listen.removeprefix("unix:"), RequestHandler
+        )
+    else:
+        host, _, port = listen.rpartition(":")
+        server = HTTPServer((host or "127.0.0.1", int(port)), RequestHandler)
+    server.build_server = build_server
+    return server
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import mmap
+import struct
+from FileSystemManager import FileSystemManager
+from typing import Any
+
+try:
+    import msgpack  # type: ignore[import-untyped]
+except ImportError:
+    msgpack = None
+
+# Layout of definitions.snapshot:
+# - header: magic, format version, codec, length of the index
+# - index: UTF-8 JSON object, key => [offset, length] of each entry, offsets
+#   starting right after the index
+# - entries, each one encoded on its own with the codec
+# Examples of keys:
+# - id, label, styles, themes, variables, libraries, dateModified
+# - components/card
+# - examples/homepage
+MAGIC = b"DILLASNP"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<8sBBI")
+
+CODECS = {
+    "json": 0,
+    "msgpack": 1,
+}
+
+# Sections split by item, to decode a single component or example.
+SPLIT_SECTIONS = ("components", "examples")
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, set):
+        return list(obj)
+    raise TypeError("Not serializable: " + type(obj).__name__)
+
+
+class SnapshotExporter:
+    def __init__(self) -> None:
+        self.codec = "msgpack" if msgpack else "json"
+
+    def export(self, data: dict[str, Any], target_path: str) -> None:
+        """Write the definition as a binary snapshot to definitions.snapshot"""
+        path = os.path.join(target_path, "definitions.snapshot")
+        FileSystemManager.write_bytes(path, self.encode(data))
+
+    def encode(self, data: dict[str, Any]) -> bytes:
+        """Encode the definition, with an offset table of its entries"""
+        index = {}
+        entries = []
+        offset = 0
+        for key, value in self._get_entries(data):
+            entry = self._encode_value(value)
+            index[key] = [offset, len(entry)]
+            entries.append(entry)
+            offset += len(entry)
+        index_data = json.dumps(index, separators=(",", ":")).encode()
+        header = HEADER.pack(
+            MAGIC, SNAPSHOT_VERSION, CODECS[self.codec], len(index_data)
+        )
+        return b"".join([header, index_data] + entries)
+
+    def _get_entries(self, data: dict[str, Any]) -> list[tuple[str, Any]]:
+        entries = []
+        for section, value in data.items():
+            if section in SPLIT_SECTIONS and isinstance(value, dict):
+                for item_id, item in value.items():
+                    entries.append((section + "/" + str(item_id), item))
+                continue
+            entries.append((section, value))
+        return entries
+
+    def _encode_value(self, value: Any) -> bytes:
+        if self.codec == "msgpack":
+            return bytes(msgpack.packb(value, default=_default, use_bin_type=True))
+        return json.dumps(
+            value, separators=(",", ":"), ensure_ascii=False, default=_default
+        ).encode()
+
+
+class SnapshotReader:
+    """Memory map a snapshot and decode its entries on demand"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, codec, index_length = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            self.buffer.close()
+            raise ValueError("Unsupported snapshot " + path)
+        self.codec = {value: key for key, value in CODECS.items()}[codec]
+        if self.codec == "msgpack" and not msgpack:
+            self.buffer.close()
+            raise RuntimeError("msgpack is needed to read " + path)
+        start = HEADER.size
+        self.index: dict[str, list[int]] = json.loads(
+            self.buffer[start : start + index_length]
+        )
+        self.start = start + index_length
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def keys(self, section: str = "") -> list[str]:
+        """List keys of the snapshot, or the item ids of a split section"""
+        if not section:
+            return list(self.index.keys())
+        prefix = section + "/"
+        return [key[len(prefix) :] for key in self.index if key.startswith(prefix)]
+
+    def get(self, key: str) -> Any:
+        """Decode a single entry, like components/card or themes"""
+        offset, length = self.index[key]
+        start = self.start + offset
+        entry = self.buffer[start : start + length]
+        if self.codec == "msgpack":
+            return msgpack.unpackb(entry, raw=False, strict_map_key=False)
+        return json.loads(entry)
+
+    def close(self) -> None:
+        """Release the memory map"""
+        self.buffer.close()
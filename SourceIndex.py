@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import logging
+import subprocess
+import fnmatch
+from YamlLoader import YamlLoader
+from typing import Any
+
+ARTIFACTS = {
+    "component": "components",
+    "style": "styles",
+    "theme": "themes",
+    "variable": "variables",
+    "example": "examples",
+    "library": "libraries",
+}
+
+STATIC_EXCLUDE_EXTENSIONS = (
+    ".yaml",
+    ".yml",
+    ".json",
+    ".twig",
+    ".jinja",
+    ".scss",
+    ".css.map",
+    ".js.map",
+    ".py",
+    ".php",
+    ".theme",
+    ".inc",
+    ".md",
+    "Makefile",
+)
+
+STATIC_EXCLUDE_FOLDERS = ("tests",)
+
+# Key of info.yml configuring the prebuilder, removed from the definitions.
+# Globs are matched against paths relative to the design system root, or
+# against file and folder names when they have no "/". Examples:
+# prebuilder:
+#   exclude: [node_modules, src/*, "*.psd"]
+#   include: [schemas/*.json]
+CONFIG_KEY = "prebuilder"
+
+# Where dateModified comes from, when not set in info.yml:
+# - mtime: the most recent modification time of the indexed files and folders
+# - git: the time of the last commit touching the design system, or mtime
+#   when it is not in a git repository
+DATE_SOURCES = ["mtime", "git"]
+
+
+class SourceIndex:
+    _instances: dict[str, "SourceIndex"] = {}
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path
+        # Examples, for the "component" artifact:
+        # - single: components/card/card.component.yml
+        # - plural: components.yml
+        # - suffixed: whatever/cards.components.yml
+        self.artifacts: dict[str, dict[str, list[str]]] = {
+            artifact: {"single": [], "plural": [], "suffixed": []}
+            for artifact in ARTIFACTS
+        }
+        self.templates: list[str] = []
+        # Template path by filename, like card.primary.jinja, the first one
+        # in path order when several folders hold the same filename.
+        self.template_names: dict[str, str] = {}
+        self.tests: list[str] = []
+        self.static: list[str] = []
+        # Most recent modification time, in seconds, found during the scan.
+        self.last_modified = 0
+        self._commit_time: int | None = None
+        config = self._load_config()
+        # Excluded files and folders are never walked, included files are
+        # static data even with an extension excluded by default.
+        self.exclude = self._compile_globs(config, "exclude")
+        self.include = self._compile_globs(config, "include")
+        self._scan()
+
+    @staticmethod
+    def get(root_path: str) -> "SourceIndex":
+        """Get the shared index of a design system, scanning it on first use"""
+        if root_path not in SourceIndex._instances:
+            SourceIndex._instances[root_path] = SourceIndex(root_path)
+        return SourceIndex._instances[root_path]
+
+    @staticmethod
+    def invalidate(root_path: str = "") -> None:
+        """Forget the shared index of a design system, or of all of them"""
+        if not root_path:
+            SourceIndex._instances.clear()
+            return
+        SourceIndex._instances.pop(root_path, None)
+
+    def artifact_paths(self) -> list[str]:
+        """Get paths of every artifact file, whatever its kind"""
+        paths = []
+        for buckets in self.artifacts.values():
+            for bucket in buckets.values():
+                paths += bucket
+        return paths
+
+    def variant_template(self, component_id: str, variant_id: str) -> str:
+        """Get the path of the template of a component variant, empty if none"""
+        return self.template_names.get(component_id + "." + variant_id + ".jinja", "")
+
+    def last_modification(self, date_source: str = "mtime") -> int:
+        """Get the timestamp of the last change of the design system"""
+        if date_source == "git":
+            if self._commit_time is None:
+                self._commit_time = self._get_commit_time()
+            if self._commit_time:
+                return self._commit_time
+        return self.last_modified
+
+    def relative(self, path: str) -> str:
+        """Get the path of an indexed file relative to the design system root"""
+        return os.path.relpath(path, self.root_path)
+
+    def _get_commit_time(self) -> int:
+        # Mounted volumes are often owned by another user than the container.
+        command = ["git", "-c", "safe.directory=*", "-C", self.root_path]
+        command += ["log", "-1", "--format=%ct", "--", "."]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired) as error:
+            raise RuntimeError("--date-source git needs git: %s" % error) from error
+        if result.returncode or not result.stdout.strip():
+            logging.warning(
+                "No git commit time for %s, use mtime: %s",
+                self.root_path,
+                result.stderr.strip() or "no commit",
+            )
+            return 0
+        return int(result.stdout.strip())
+
+    def _load_config(self) -> dict[str, Any]:
+        path = os.path.join(self.root_path, "info.yml")
+        if not os.path.exists(path):
+            return {}
+        config = (YamlLoader.load(path) or {}).get(CONFIG_KEY) or {}
+        if not isinstance(config, dict):
+            raise ValueError("%s: %s must be a mapping" % (path, CONFIG_KEY))
+        return config
+
+    def _compile_globs(
+        self, config: dict[str, Any], key: str
+    ) -> re.Pattern[str] | None:
+        globs = config.get(key) or []
+        if not isinstance(globs, list):
+            raise ValueError("%s.%s must be a list of globs" % (CONFIG_KEY, key))
+        patterns = []
+        for pattern in globs:
+            if "/" in pattern:
+                patterns.append(fnmatch.translate(pattern.strip("/")))
+                continue
+            patterns.append("(?:.*/)?" + fnmatch.translate(pattern))
+        if not patterns:
+            return None
+        # A single test for every glob.
+        return re.compile("|".join(patterns))
+
+    def _scan(self) -> None:
+        # Hidden files and folders are ignored, like glob() does.
+        stack = [""]
+        while stack:
+            relative_dir = stack.pop()
+            with os.scandir(os.path.join(self.root_path, relative_dir)) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    relative_path = os.path.join(relative_dir, entry.name)
+                    if self.exclude and self.exclude.match(relative_path):
+                        continue
+                    # Cached by the entry, a single stat() call on Linux.
+                    mtime = int(entry.stat().st_mtime)
+                    if mtime > self.last_modified:
+                        self.last_modified = mtime
+                    if entry.is_dir():
+                        stack.append(relative_path)
+                        continue
+                    self._add(relative_path, entry.name)
+        for buckets in self.artifacts.values():
+            for paths in buckets.values():
+                paths.sort()
+        self.templates.sort()
+        for path in self.templates:
+            self.template_names.setdefault(os.path.basename(path), path)
+        self.tests.sort()
+        self.static.sort()
+
+    def _add(self, relative_path: str, filename: str) -> None:
+        path = os.path.join(self.root_path, relative_path)
+        top_folder = relative_path.split(os.sep, 1)[0]
+        if filename.endswith(".yml"):
+            self._add_artifact(path, filename)
+        if filename.endswith(".jinja") and top_folder == "components":
+            self.templates.append(path)
+        if top_folder == "tests" and top_folder != relative_path:
+            self.tests.append(path)
+        if self.include and self.include.match(relative_path):
+            self.static.append(path)
+            return
+        if top_folder in STATIC_EXCLUDE_FOLDERS and top_folder != relative_path:
+            return
+        if filename.endswith(STATIC_EXCLUDE_EXTENSIONS):
+            return
+        self.static.append(path)
+
+    def _add_artifact(self, path: str, filename: str) -> None:
+        for artifact, plural in ARTIFACTS.items():
+            if filename.endswith("." + artifact + ".yml"):
+                self.artifacts[artifact]["single"].append(path)
+                return
+            if filename == plural + ".yml":
+                self.artifacts[artifact]["plural"].append(path)
+                return
+            if filename.endswith("." + plural + ".yml"):
+                self.artifacts[artifact]["suffixed"].append(path)
+                return
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import cProfile
+import resource
+from FileSystemManager import FileSystemManager
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class StageProfiler:
+    def __init__(self, profile_path: str = ""):
+        # Folder of the cProfile dumps, disabled when empty.
+        self.profile_path = profile_path
+        # Examples: parse, definitions, rust, schema, templates, examples, static
+        self.stages: dict[str, dict[str, Any]] = {}
+        self._stack: list[dict[str, Any]] = []
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[dict[str, Any]]:
+        """Record times, memory and written files of a stage"""
+        # Times of nested stages are only counted by themselves, like parse
+        # running inside the first stage needing the definition.
+        parent = self._stack[-1] if self._stack else None
+        if parent and parent["profile"]:
+            parent["profile"].disable()
+        profile = cProfile.Profile() if self.profile_path else None
+        if parent:
+            # Kept apart, as the peak is reset for the nested stage.
+            parent["peak"] = max(parent["peak"], self._get_peak())
+        self._reset_peak()
+        frame: dict[str, Any] = {
+            "nested_wall": 0.0,
+            "nested_cpu": 0.0,
+            "nested_rss": 0,
+            "peak": 0,
+            "profile": profile,
+        }
+        self._stack.append(frame)
+        record: dict[str, Any] = {"skipped": False}
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_rss = self._get_rss()
+        if profile:
+            profile.enable()
+        try:
+            with FileSystemManager.track() as outputs:
+                yield record
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            rss = self._get_rss() - start_rss
+            self._stack.pop()
+            frame["peak"] = max(frame["peak"], self._get_peak())
+            if parent:
+                parent["nested_wall"] += wall
+                parent["nested_cpu"] += cpu
+                parent["nested_rss"] += rss
+                parent["peak"] = max(parent["peak"], frame["peak"])
+                self._reset_peak()
+                if parent["profile"]:
+                    parent["profile"].enable()
+            paths = set(outputs)
+            record |= {
+                "wall": round(wall - frame["nested_wall"], 6),
+                "cpu": round(cpu - frame["nested_cpu"], 6),
+                # Memory kept by the stage, negative when it freed some.
+                "rss_delta": rss - frame["nested_rss"],
+                # Highest resident memory during the stage, nested ones included.
+                "memory_peak": frame["peak"],
+                "files": len(paths),
+                "bytes": sum(
+                    os.path.getsize(path) for path in paths if os.path.exists(path)
+                ),
+            }
+            self.stages[stage] = record
+            if profile and not record["skipped"]:
+                os.makedirs(self.profile_path, exist_ok=True)
+                profile.dump_stats(os.path.join(self.profile_path, stage + ".prof"))
+
+    def _get_rss(self) -> int:
+        # Current resident memory, ru_maxrss only grows with the process.
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            return 0
+
+    def _reset_peak(self) -> None:
+        # Resets VmHWM to the current resident memory, since Linux 4.0.
+        try:
+            with open("/proc/self/clear_refs", "w") as file:
+                file.write("5")
+        except OSError:
+            pass
+
+    def _get_peak(self) -> int:
+        try:
+            with open("/proc/self/status") as file:
+                for line in file:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        # Peak of the whole process, in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
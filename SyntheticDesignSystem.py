@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from FileSystemManager import FileSystemManager
+from typing import Any, TypedDict
+
+# Minimal generic schema, with the definitions SchemaGenerator fills, so
+# benchmarks do not depend on the network.
+GENERIC_SCHEMA: dict[str, Any] = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$ref": "#/$defs/renderable",
+    "$defs": {
+        "renderable": {
+            "anyOf": [
+                {"$ref": "#/$defs/component_renderable"},
+                {"type": "array", "items": {"$ref": "#/$defs/renderable"}},
+                {"type": "string"},
+            ]
+        },
+        "component_renderable": {
+            "type": "object",
+            "title": "Component",
+            "properties": {
+                "@component": {"type": "string"},
+                "@variant": {"type": "string", "description": "Variant ID"},
+                "@attributes": {"type": "object"},
+                "@styles": {"$ref": "#/$defs/styles_property"},
+                "@theme": {"$ref": "#/$defs/theme_property"},
+                "@local_variables": {"$ref": "#/$defs/local_variables_property"},
+            },
+            "patternProperties": {"^[a-z]": {"$ref": "#/$defs/slot_value"}},
+        },
+        "slot_value": {"$ref": "#/$defs/renderable"},
+        "styles_property": {"type": "array", "items": {"type": "string"}},
+        "theme_property": {"type": "string"},
+        "local_variables_property": {"type": "object"},
+    },
+}
+
+
+class Tier(TypedDict):
+    components: int
+    variants: int
+    examples: int
+
+
+# Examples of tiers: components x variants x examples
+TIERS: dict[str, Tier] = {
+    "small": {"components": 10, "variants": 3, "examples": 2},
+    "medium": {"components": 100, "variants": 5, "examples": 3},
+    "large": {"components": 400, "variants": 10, "examples": 5},
+}
+
+
+class SyntheticDesignSystem:
+    def __init__(
+        self,
+        components: int,
+        variants: int,
+        examples: int,
+        libraries: int = 5,
+        styles: int = 20,
+        themes: int = 4,
+        variables: int = 50,
+        system_id: str = "synthetic",
+    ):
+        self.components = components
+        self.variants = variants
+        self.examples = examples
+        self.libraries = libraries
+        self.styles = styles
+        self.themes = themes
+        self.variables = variables
+        self.system_id = system_id
+
+    def write(self, root_path: str) -> str:
+        """Write the design system source files, and get its folder"""
+        path = os.path.join(root_path, self.system_id)
+        self._write_yaml(path, "info.yml", {"id": self.system_id, "label": "Synth"})
+        self._write_yaml(path, "libraries.yml", self._get_libraries())
+        self._write_yaml(path, "styles/all.styles.yml", self._get_styles())
+        self._write_yaml(path, "themes.yml", self._get_themes())
+        self._write_yaml(path, "variables.yml", self._get_variables())
+        for index in range(self.components):
+            self._write_component(path, "component_%d" % index)
+        for index in range(self.examples):
+            example = {"renderable": self._get_renderable("component_0", index)}
+            self._write_yaml(path, "examples/page_%d.example.yml" % index, example)
+        for index in range(self.libraries):
+            self._write(path, "css/library_%d.css" % index, ".l%d{}" % index)
+            self._write(path, "js/library_%d.js" % index, "// %d" % index)
+        self._write(path, "images/logo.png", "\x89PNG" + "0" * 4096)
+        self._write(path, "tests/home.json", "{}")
+        return path
+
+    def _write_component(self, path: str, component_id: str) -> None:
+        folder = "components/%s/" % component_id
+        component = {
+            "label": component_id,
+            "variants": {
+                "variant_%d" % index: {"label": "Variant %d" % index}
+                for index in range(self.variants)
+            },
+            "props": {
+                "title": {"title": "Title", "schema": {"type": "string"}},
+                "size": {"schema": {"type": "integer", "minimum": 0}},
+                "level": {"schema": {"enum": [1, 2, 3, 4]}},
+            },
+            "slots": {"content": {"title": "Content"}, "footer": {}},
+            "library": {
+                "css": {component_id + ".css": {}},
+                "js": {component_id + ".js": {"defer": True}},
+                "dependencies": ["library_0"],
+            },
+            "examples": {
+                "example_%d" % index: {
+                    "renderable": self._get_renderable(component_id, index)
+                }
+                for index in range(self.examples)
+            },
+        }
+        self._write_yaml(path, folder + component_id + ".component.yml", component)
+        template = '<div class="{{ size }}"><img src="@root/images/logo.png">'
+        template += "{{ title }}{{ content }}</div>\n"
+        self._write(path, folder + component_id + ".jinja", template)
+        # Half of the variants have their own template.
+        for index in range(0, self.variants, 2):
+            filename = "%s.variant_%d.jinja" % (component_id, index)
+            self._write(path, folder + filename, template)
+        self._write(path, folder + component_id + ".css", ".c{}")
+        self._write(path, folder + component_id + ".js", "// js")
+        self._write(path, folder + component_id + ".scss", ".c{}")
+
+    def _get_renderable(self, component_id: str, index: int) -> dict[str, Any]:
+        return {
+            "@component": component_id,
+            "@variant": "variant_0",
+            "title": "Example %d" % index,
+            "size": index,
+            "content": [
+                {"@element": "img", "src": "/images/logo.png"},
+                {"@component": "component_0", "title": "Nested"},
+                "Text",
+            ],
+        }
+
+    def _get_libraries(self) -> dict[str, Any]:
+        libraries = {}
+        for index in range(self.libraries):
+            libraries["library_%d" % index] = {
+                "default": index == 0,
+                "css": {"css/library_%d.css" % index: {"media": "all"}},
+                "js": {"js/library_%d.js" % index: {"async": True}},
+            }
+        return libraries
+
+    def _get_styles(self) -> dict[str, Any]:
+        return {
+            "style_%d" % index: {
+                "label": "Style %d" % index,
+                "options": {
+                    "style-%d-%d" % (index, option): {"label": str(option)}
+                    for option in range(5)
+                },
+            }
+            for index in range(self.styles)
+        }
+
+    def _get_themes(self) -> dict[str, Any]:
+        return {
+            "theme_%d" % index: {"label": "Theme %d" % index, "key": "class"}
+            for index in range(self.themes)
+        }
+
+    def _get_variables(self) -> dict[str, Any]:
+        return {
+            "variable_%d" % index: {
+                "type": "string",
+                "default": {":root": "#%06x" % index},
+            }
+            for index in range(self.variables)
+        }
+
+    def _write_yaml(self, path: str, relative_path: str, data: Any) -> None:
+        # JSON is valid YAML, and much faster to write.
+        self._write(path, relative_path, json.dumps(data, indent=2))
+
+    def _write(self, path: str, relative_path: str, content: str) -> None:
+        FileSystemManager.write_file(os.path.join(path, relative_path), content)
@@ -2,7 +2,8 @@
 
 from FileSystemManager import FileSystemManager
 from DesignSystem import DesignSystem
-import glob
+from SourceIndex import SourceIndex
+import os
 
 
 class TemplateManager:
@@ -11,16 +12,12 @@ class TemplateManager:
 
     def copy(self, source_path: str, target_path: str) -> None:
         """Copy template files to the expected folder and replace placeholders"""
-        pattern = source_path + "/components/**/*.jinja"
-        paths = glob.glob(pattern, recursive=True)
-        for path in paths:
-            dst = path.replace(source_path, target_path)
-            FileSystemManager.copy_file(path, dst)
-            self._replace_placeholder(dst)
+        index = SourceIndex.get(source_path)
+        for path in index.templates:
+            dst = os.path.join(target_path, index.relative(path))
+            FileSystemManager.write_file(dst, self._replace_placeholder(path))
 
-    def _replace_placeholder(self, path: str) -> None:
+    def _replace_placeholder(self, path: str) -> str:
         with open(path, "r") as template:
             content = template.read()
-            content = content.replace("@root/", self.design_system.cdn + "/")
-        with open(path, "w") as template:
-            template.write(content)
+        return content.replace("@root/", self.design_system.cdn + "/")
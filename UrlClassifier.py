@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+import re
+import functools
+
+# Images served by the CDN, as root relative paths in renderables.
+IMAGE_PATH = re.compile(r"/[^ ]*\.(?:jpg|png|jpeg|svg)\Z")
+
+
+class UrlClassifier:
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def is_url(value: str) -> bool:
+        """Check if a string is a valid URL, with cheap rejection first"""
+        # A URL has a scheme, so a colon, and never spaces.
+        if ":" not in value or " " in value:
+            return False
+        # Imported on first use, slow to load and only needed by builds.
+        import validators
+
+        return bool(validators.url(value))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def is_image_path(value: str) -> bool:
+        """Check if a string is a root relative path to an image"""
+        # Such a path has no scheme, so it is never a URL.
+        return IMAGE_PATH.match(value) is not None
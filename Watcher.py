@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+
+# From sys/inotify.h
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT = struct.Struct("iIII")
+
+
+class Watcher:
+    def __init__(
+        self,
+        root_path: str,
+        debounce: float = 0.2,
+        interval: float = 1.0,
+        polling: bool = False,
+    ):
+        self.root_path = root_path
+        # Quiet time closing a burst of changes.
+        self.debounce = debounce
+        # Time between two scans, when polling.
+        self.interval = interval
+        self.fd = -1
+        self.watches: dict[int, str] = {}
+        self.snapshot: dict[str, tuple[int, int]] = {}
+        if not polling:
+            self._start_inotify()
+        if self.fd < 0:
+            logging.info("Watch %s by polling every %ss", root_path, interval)
+            self.snapshot = self._scan()
+
+    def wait(self) -> set[str]:
+        """Block until files change, and get the paths changed during the burst"""
+        changes: set[str] = set()
+        while True:
+            batch = self._read(self.debounce if changes else None)
+            if not batch and changes:
+                return changes
+            changes |= batch
+
+    def close(self) -> None:
+        """Stop listening to filesystem events"""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _read(self, timeout: float | None) -> set[str]:
+        if self.fd >= 0:
+            return self._read_inotify(timeout)
+        time.sleep(self.interval if timeout is None else timeout)
+        snapshot = self._scan()
+        changes = {
+            path
+            for path in snapshot.keys() | self.snapshot.keys()
+            if snapshot.get(path) != self.snapshot.get(path)
+        }
+        self.snapshot = snapshot
+        return changes
+
+    def _start_inotify(self) -> None:
+        try:
+            self.libc = ctypes.CDLL(
+                ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+            )
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            self.fd = -1
+        if self.fd < 0:
+            return
+        try:
+            self._add_watches(self.root_path)
+        except OSError as error:
+            # Like too many folders for fs.inotify.max_user_watches.
+            logging.warning("inotify unavailable: %s", error)
+            self.close()
+
+    def _add_watches(self, path: str) -> None:
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(code, os.strerror(code), folder)
+            self.watches[wd] = folder
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and not self._ignore(
+                        entry.name
+                    ):
+                        stack.append(entry.path)
+
+    def _read_inotify(self, timeout: float | None) -> set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changes: set[str] = set()
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT.unpack_from(buffer, offset)
+            offset += EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, everything may have changed.
+                logging.warning("Too many changes at once, rebuild everything")
+                changes.add(self.root_path)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+            path = self.watches[wd]
+            if name:
+                if self._ignore(os.fsdecode(name)):
+                    continue
+                path = os.path.join(path, os.fsdecode(name))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._add_watches(path)
+                except OSError as error:
+                    # Remaining events are dropped, everything may have changed.
+                    logging.warning("inotify unavailable, poll instead: %s", error)
+                    self.close()
+                    self.snapshot = self._scan()
+                    changes.add(self.root_path)
+                    return changes
+            changes.add(path)
+        return changes
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        stack = [self.root_path]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if self._ignore(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _ignore(self, name: str) -> bool:
+        # Hidden files, like .git or editor swap files, and backup files.
+        return name.startswith(".") or name.endswith("~")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import hashlib
+import pickle
+import threading
+import yaml
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+# The libyaml based loader is much faster, when PyYAML was compiled with it.
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+CACHE_VERSION = "1-" + yaml.__version__ + "-" + Loader.__name__
+
+# Below this number of files to parse, starting processes costs more than it saves.
+PROCESS_POOL_THRESHOLD = 64
+
+
+class YamlLoader:
+    # Folder of the parsed files cache, disabled when empty.
+    cache_dir: str = os.environ.get("CACHE_DIR", "")
+    # Parsing processes, files are parsed in the current process when below 2.
+    processes: int = 0
+    # Pickled cache entries kept by long running processes, like watch.
+    memory: dict[str, bytes] | None = None
+
+    @staticmethod
+    def load(path: str) -> Any:
+        """Load a YAML file, from the parsed files cache when unchanged"""
+        return YamlLoader.load_many([path])[0]
+
+    @staticmethod
+    def load_many(paths: list[str]) -> list[Any]:
+        """Load YAML files concurrently, results keep the order of the paths"""
+        # Threads for the I/O: reading files and cache entries.
+        lookups = YamlLoader._map_threads(YamlLoader._lookup, paths)
+        misses = [lookup for lookup in lookups if "data" not in lookup]
+        contents = [lookup["content"] for lookup in misses]
+        names = [lookup["path"] for lookup in misses]
+        # Processes for the CPU bound parsing.
+        if YamlLoader.processes > 1 and len(misses) >= PROCESS_POOL_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=YamlLoader.processes) as executor:
+                parsed = list(
+                    executor.map(YamlLoader.parse, contents, names, chunksize=8)
+                )
+        else:
+            parsed = [
+                YamlLoader.parse(content, name)
+                for content, name in zip(contents, names)
+            ]
+        for lookup, data in zip(misses, parsed):
+            lookup["data"] = data
+            lookup["store"] = True
+        if YamlLoader.cache_dir or YamlLoader.memory is not None:
+            stale = [lookup for lookup in lookups if lookup.get("store")]
+            YamlLoader._map_threads(YamlLoader._store, stale)
+        return [lookup["data"] for lookup in lookups]
+
+    @staticmethod
+    def parse(content: bytes | str, name: str = "") -> Any:
+        """Parse YAML content with the fastest available safe loader"""
+        if not name:
+            return yaml.load(content, Loader=Loader)
+        # Errors name the stream, like a file, instead of "<byte string>".
+        stream = io.BytesIO(content if isinstance(content, bytes) else content.encode())
+        stream.name = name
+        return yaml.load(stream, Loader=Loader)
+
+    @staticmethod
+    def _map_threads(function: Callable[[Any], Any], items: list[Any]) -> list[Any]:
+        if len(items) < 2:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(function, items))
+
+    @staticmethod
+    def _lookup(path: str) -> dict[str, Any]:
+        if not YamlLoader.cache_dir and YamlLoader.memory is None:
+            with open(path, "rb") as file:
+                return {"path": path, "content": file.read()}
+        stat = os.stat(path)
+        lookup: dict[str, Any] = {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        }
+        entry = YamlLoader._read_entry(path)
+        if (
+            entry
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime_ns
+        ):
+            return lookup | {"data": entry["data"]}
+        with open(path, "rb") as file:
+            lookup["content"] = file.read()
+        lookup["sha256"] = hashlib.sha256(lookup["content"]).hexdigest()
+        # Touched but not modified files are not parsed again.
+        if entry and entry["sha256"] == lookup["sha256"]:
+            lookup |= {"data": entry["data"], "store": True}
+        return lookup
+
+    @staticmethod
+    def _get_entry_path(path: str) -> str:
+        key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(YamlLoader.cache_dir, "yaml", key[:2], key + ".pickle")
+
+    @staticmethod
+    def _read_entry(path: str) -> dict[str, Any] | None:
+        if YamlLoader.memory and path in YamlLoader.memory:
+            # Unpickled each time, callers are free to edit the data.
+            return dict(pickle.loads(YamlLoader.memory[path]))
+        if not YamlLoader.cache_dir:
+            return None
+        try:
+            with open(YamlLoader._get_entry_path(path), "rb") as file:
+                content = file.read()
+            entry = pickle.loads(content)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if not isinstance(entry, dict) or entry.get("version") != CACHE_VERSION:
+            return None
+        if entry.get("path") != path:
+            return None
+        if YamlLoader.memory is not None:
+            YamlLoader.memory[path] = content
+        return entry
+
+    @staticmethod
+    def _store(lookup: dict[str, Any]) -> None:
+        entry = {
+            "version": CACHE_VERSION,
+            "path": lookup["path"],
+            "size": lookup["size"],
+            "mtime": lookup["mtime"],
+            "sha256": lookup["sha256"],
+            "data": lookup["data"],
+        }
+        content = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        if YamlLoader.memory is not None:
+            YamlLoader.memory[lookup["path"]] = content
+        if not YamlLoader.cache_dir:
+            return
+        entry_path = YamlLoader._get_entry_path(lookup["path"])
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # Write then rename, so concurrent builds never read a partial entry.
+        temporary_path = "%s.%d.%d" % (entry_path, os.getpid(), threading.get_ident())
+        with open(temporary_path, "wb") as file:
+            file.write(content)
+        os.replace(temporary_path, entry_path)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+from DesignSystem import DesignSystem
+from RustGenerator import RustGenerator
+from SchemaGenerator import SchemaGenerator
+from ExamplesExporter import ExamplesExporter
+from TemplateManager import TemplateManager
+from SourceIndex import SourceIndex
+from YamlLoader import YamlLoader
+from SyntheticDesignSystem import SyntheticDesignSystem, GENERIC_SCHEMA, TIERS
+from prebuilder import copy_static_data, configure_logging
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Callable
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark.baseline.json")
+PREBUILDER_PATH = os.path.join(os.path.dirname(__file__), "prebuilder.py")
+STARTUP_COMMANDS = ["data", "build", "run"]
+
+
+def measure(
+    callback: Callable[[], Any], repeat: int, output_path: str = ""
+) -> tuple[float, Any]:
+    """Run a stage several times, and get its best time and last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        # Unchanged files are not written again, each run starts from scratch.
+        if output_path:
+            shutil.rmtree(output_path, ignore_errors=True)
+        start = time.perf_counter()
+        result = callback()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_tier(tier: str, work_path: str, repeat: int) -> dict[str, float]:
+    """Generate a synthetic design system, then time each stage on it"""
+    source_path = SyntheticDesignSystem(**TIERS[tier]).write(
+        os.path.join(work_path, tier, "input")
+    )
+    target_path = os.path.join(work_path, tier, "output", "build/")
+    data_path = os.path.join(work_path, tier, "output", "data/")
+    timings = {}
+
+    def parse() -> DesignSystem:
+        # Cold parse: no parsed files cache, and a new scan of the sources.
+        SourceIndex.invalidate(source_path)
+        return DesignSystem(source_path, "https://cdn.example.com/" + tier)
+
+    timings["parse"], design_system = measure(parse, repeat)
+    data = design_system.getData()
+    timings["definitions"], _ = measure(
+        lambda: design_system.export(target_path), repeat, target_path
+    )
+    rust_generator = RustGenerator()
+    timings["rust"], _ = measure(
+        lambda: rust_generator.generate(data, source_path), repeat
+    )
+    schema_generator = SchemaGenerator(GENERIC_SCHEMA)
+    timings["schema"], _ = measure(lambda: schema_generator.generate(data), repeat)
+    template_manager = TemplateManager(design_system)
+    timings["templates"], _ = measure(
+        lambda: template_manager.copy(source_path, target_path), repeat, target_path
+    )
+    examples_exporter = ExamplesExporter()
+    timings["examples"], _ = measure(
+        lambda: examples_exporter.export(data, target_path), repeat, target_path
+    )
+    timings["static"], _ = measure(
+        lambda: copy_static_data(source_path, data_path, "copy"), repeat, data_path
+    )
+    return timings
+
+
+def run_startup(commands: list[str], work_path: str, repeat: int) -> dict[str, float]:
+    """Time commands from a new interpreter, with the time spent importing"""
+    root_path = os.path.join(work_path, "startup")
+    SyntheticDesignSystem(**TIERS["small"]).write(os.path.join(root_path, "input"))
+    schema_path = os.path.join(root_path, "renderable.schema.json")
+    with open(schema_path, "w") as file:
+        json.dump(GENERIC_SCHEMA, file)
+    target_root = os.path.join(root_path, "output")
+    # Cold: no parsed files cache, and no network.
+    env = os.environ | {
+        "SOURCE_ROOT": os.path.join(root_path, "input"),
+        "TARGET_ROOT": target_root,
+        "SCHEMA": schema_path,
+        "CACHE_DIR": "",
+    }
+    timings = {}
+    for command in commands:
+        arguments = [sys.executable, PREBUILDER_PATH, command, "--jobs", "1"]
+        timings[command], _ = measure(
+            lambda: subprocess.run(arguments, env=env, check=True, capture_output=True),
+            repeat,
+            target_root,
+        )
+        # Apart, as -X importtime slows imports down.
+        imports = []
+        for _ in range(repeat):
+            shutil.rmtree(target_root, ignore_errors=True)
+            imports.append(sum_import_time(arguments, env))
+        timings[command + "_imports"] = min(imports)
+    return timings
+
+
+def sum_import_time(arguments: list[str], env: dict[str, str]) -> float:
+    """Run a command with -X importtime, and get its total import time"""
+    process = subprocess.run(
+        arguments[:1] + ["-X", "importtime"] + arguments[1:],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    # Examples:
+    # import time: self [us] | cumulative | imported package
+    # import time:       568 |      66197 | jinja2
+    total = 0
+    for line in process.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            total += int(fields[0])
+    return total / 1000000
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+) -> list[str]:
+    """List stages slower than the baseline by more than the threshold"""
+    regressions = []
+    for tier, timings in results.items():
+        for stage, duration in timings.items():
+            reference = baseline.get(tier, {}).get(stage)
+            if not reference:
+                continue
+            if duration > reference * (1 + threshold):
+                regressions.append(
+                    "%s %s: %.4fs, baseline %.4fs (+%d%%)"
+                    % (
+                        tier,
+                        stage,
+                        duration,
+                        reference,
+                        (duration / reference - 1) * 100,
+                    )
+                )
+    return regressions
+
+
+def log_results(
+    results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]]
+) -> None:
+    for tier, timings in results.items():
+        logging.info("%s: %s", tier, TIERS.get(tier, TIERS["small"]))
+        for stage, duration in timings.items():
+            reference = baseline.get(tier, {}).get(stage)
+            delta = ""
+            if reference:
+                delta = "%+6.1f%%" % ((duration / reference - 1) * 100)
+            logging.info("  %-14s %9.4fs %s", stage, duration, delta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dilla prebuilder benchmark")
+    parser.add_argument(
+        "--tiers",
+        default="small,medium",
+        help="comma separated sizes among: " + ", ".join(TIERS.keys()),
+    )
+    parser.add_argument(
+        "--commands",
+        default=",".join(STARTUP_COMMANDS),
+        help="comma separated commands timed from a new interpreter, on the "
+        "small tier, empty to skip",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs of each stage, the best time is kept",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_PATH,
+        help="JSON file of reference timings, default: benchmark.baseline.json",
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="store the timings as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="slowdown ratio flagged as a regression, default: 0.25",
+    )
+    args = parser.parse_args()
+    tiers = [tier.strip() for tier in args.tiers.split(",") if tier.strip()]
+    for tier in tiers:
+        if tier not in TIERS:
+            parser.error("unknown tier " + tier)
+    commands = [command.strip() for command in args.commands.split(",")]
+    commands = [command for command in commands if command]
+    for command in commands:
+        if command not in STARTUP_COMMANDS:
+            parser.error("unknown command " + command)
+    configure_logging()
+    # Stages are timed on their own, without the caches of a real build.
+    YamlLoader.cache_dir = ""
+    logging.getLogger().setLevel(logging.WARNING)
+    work_path = tempfile.mkdtemp(prefix="prebuilder-benchmark-")
+    try:
+        results = {tier: run_tier(tier, work_path, args.repeat) for tier in tiers}
+        if commands:
+            results["startup"] = run_startup(commands, work_path, args.repeat)
+    finally:
+        shutil.rmtree(work_path)
+    logging.getLogger().setLevel(logging.INFO)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)["tiers"]
+    log_results(results, baseline)
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump({"version": 1, "tiers": baseline | results}, file, indent=4)
+        logging.info("Baseline saved to %s", args.baseline)
+        sys.exit(0)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        logging.error("REGRESSION %s", regression)
+    if regressions:
+        sys.exit(1)
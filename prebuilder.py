@@ -1,117 +1,570 @@
 #!/usr/bin/env python3
 
-from FileSystemManager import FileSystemManager
-from DesignSystem import DesignSystem
-from RustGenerator import RustGenerator
-from SchemaGenerator import SchemaGenerator
-from ExamplesExporter import ExamplesExporter
-from TemplateManager import TemplateManager
+# Modules only used by some commands are imported by the functions running
+# them, the data command does not load the generators, jinja2, requests,
+# mergedeep or validators.
+from FileSystemManager import FileSystemManager, PUBLISH_METHODS
+from BuildOptions import SCHEMA_MODES, RUST_TEMPLATES, EXAMPLES_FORMATS
+from SourceIndex import SourceIndex, DATE_SOURCES
+from BuildManifest import BuildManifest
+from YamlLoader import YamlLoader
+from StageProfiler import StageProfiler
 import sys
 import glob
 import os
+import time
+import socket
+import argparse
+import functools
+import json
 import logging
-import coloredlogs
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Callable
 
-SOURCE_ROOT = "/data/input"
-TARGET_ROOT = "/data/output"
+if TYPE_CHECKING:
+    from DesignSystem import DesignSystem
 
-coloredlogs.install(level="INFO", stream=sys.stdout)
+SOURCE_ROOT = os.environ.get("SOURCE_ROOT", "/data/input")
+TARGET_ROOT = os.environ.get("TARGET_ROOT", "/data/output")
 
+# Same output as coloredlogs, without colors.
+LOG_FORMAT = "%(asctime)s {} %(name)s[%(process)d] %(levelname)s %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-def copy_tests(source_path: str, target_path: str) -> None:
-    source_path = os.path.join(source_path, "tests")
-    target_path = os.path.join(target_path, "tests")
-    if not os.path.exists(source_path):
+
+def configure_logging() -> None:
+    """Log to stdout, in colors on terminals"""
+    if sys.stdout.isatty():
+        import coloredlogs
+
+        coloredlogs.install(level="INFO", stream=sys.stdout)
         return
-    FileSystemManager.copy_directory(source_path, target_path)
-
-
-def copy_static_data(source_path: str, target_path: str) -> None:
-    EXCLUDE_EXTENSIONS = [
-        ".yaml",
-        ".yml",
-        ".json",
-        ".twig",
-        ".jinja",
-        ".scss",
-        ".css.map",
-        ".js.map",
-        ".py",
-        ".php",
-        ".theme",
-        ".inc",
-        ".md",
-        "Makefile",
-    ]
-    EXCLUDE_FOLDERS = [
-        "tests/",
-    ]
-    pattern = os.path.join(source_path, "**", "*")
-    paths = glob.glob(pattern, recursive=True)
-    paths = [path for path in paths if not os.path.isdir(path)]
-    for folder in EXCLUDE_FOLDERS:
-        folder = os.path.join(source_path, folder)
-        paths = [path for path in paths if not path.startswith(folder)]
-    for extension in EXCLUDE_EXTENSIONS:
-        paths = [path for path in paths if not path.endswith(extension)]
-    for path in paths:
-        dst = path.replace(source_path, target_path)
+    # Pipelines do not show colors, so coloredlogs is not worth loading.
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stdout,
+        format=LOG_FORMAT.format(socket.gethostname()),
+        datefmt=LOG_DATE_FORMAT,
+    )
+
+
+def copy_tests(source_path: str, target_path: str) -> None:
+    index = SourceIndex.get(source_path)
+    for path in index.tests:
+        dst = os.path.join(target_path, index.relative(path))
         FileSystemManager.copy_file(path, dst)
 
 
-def run_build(cdn: str) -> None:
+def copy_static_data(source_path: str, target_path: str, method: str) -> None:
+    index = SourceIndex.get(source_path)
+    files = {
+        path: os.path.join(target_path, index.relative(path)) for path in index.static
+    }
+    FileSystemManager.publish(files, target_path, method)
+
+
+class LogCollector(logging.Handler):
+    """Keep log records of a worker process to replay them in the main one"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Store a picklable copy of the record"""
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def find_design_systems() -> list[str]:
     pattern = os.path.join(SOURCE_ROOT, "**", "info.yml")
-    generic_schema = SchemaGenerator.get_generic_schema()
-    for path in glob.glob(pattern, recursive=True):
-        logging.info(path)
-        source_path = os.path.dirname(path)
-        target_path = source_path.replace(SOURCE_ROOT, TARGET_ROOT)
-        target_path = os.path.join(target_path, "build/")
-        design_system = DesignSystem(source_path, cdn)
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def run_stage(
+    profiler: StageProfiler,
+    manifest: BuildManifest | None,
+    stage: str,
+    inputs: list[str],
+    extra: list[str],
+    callback: Callable[[], None],
+) -> None:
+    """Run a build stage, unless its inputs are unchanged since the last build"""
+    with profiler.measure(stage) as record:
+        if not manifest:
+            callback()
+            return
+        fingerprint = manifest.fingerprint(inputs, extra)
+        if manifest.is_fresh(stage, fingerprint):
+            logging.info("SKIP %s, inputs unchanged", stage)
+            record["skipped"] = True
+            return
+        with FileSystemManager.track() as outputs:
+            callback()
+        manifest.record(stage, fingerprint, outputs)
+
+
+def open_manifest(
+    source_path: str, target_path: str, incremental: bool
+) -> BuildManifest | None:
+    """Load the manifest of an incremental build, or purge the target folder"""
+    manifest = BuildManifest(source_path, target_path) if incremental else None
+    if not manifest or not manifest.exists():
+        BuildManifest.remove(target_path)
         FileSystemManager.prepare_target(target_path)
-        design_system.export(target_path)
-        definition = design_system.getData()
+    return manifest
+
 
-        rust_generator = RustGenerator()
-        rust = rust_generator.generate(definition, source_path)
+def build_design_system(
+    source_path: str,
+    options: dict[str, Any],
+    generic_schema: dict[str, Any],
+    profiler: StageProfiler,
+) -> None:
+    from DesignSystem import DesignSystem
+    from RustGenerator import RustGenerator
+    from SchemaGenerator import SchemaGenerator
+    from ExamplesExporter import ExamplesExporter
+    from SnapshotExporter import SnapshotExporter
+    from TemplateManager import TemplateManager
+
+    target_path = source_path.replace(SOURCE_ROOT, TARGET_ROOT)
+    target_path = os.path.join(target_path, "build/")
+    cdn = options["cdn"]
+    index = SourceIndex.get(source_path)
+
+    @functools.cache
+    def design_system() -> "DesignSystem":
+        with profiler.measure("parse"):
+            return DesignSystem(source_path, cdn, options["date_source"])
+
+    if not options["incremental"]:
+        # Parse before purging, to keep the previous build if it fails.
+        design_system()
+    manifest = open_manifest(source_path, target_path, options["incremental"])
+    definition_inputs = [os.path.join(source_path, "info.yml")]
+    definition_inputs += index.artifact_paths()
+    template_names = [index.relative(path) for path in index.templates]
+
+    def export_definitions() -> None:
+        design_system().export(target_path, options["compact"])
+        if options["snapshot"]:
+            SnapshotExporter().export(design_system().getData(), target_path)
+
+    def export_rust() -> None:
+        rust_generator = RustGenerator(options["rust_mode"])
+        rust = rust_generator.generate(design_system().getData(), source_path)
         rust_generator.export(rust, target_path)
 
-        schema_generator = SchemaGenerator(generic_schema)
-        schema = schema_generator.generate(definition)
-        schema_generator.export(schema, target_path)
+    def export_schema() -> None:
+        schema_generator = SchemaGenerator(generic_schema, options["schema_mode"])
+        schema = schema_generator.generate(design_system().getData())
+        schema_generator.export(schema, target_path, options["compact"])
 
-        template_manager = TemplateManager(design_system)
+    def copy_templates() -> None:
+        template_manager = TemplateManager(design_system())
         template_manager.copy(source_path, target_path)
+
+    def export_examples() -> None:
         # Before ExamplesExporter to avoid conflicts.
         copy_tests(source_path, target_path)
-
         examples_exporter = ExamplesExporter()
-        examples_exporter.export(definition, target_path)
+        examples_exporter.export(
+            design_system().getData(),
+            target_path,
+            options["compact"],
+            options["examples_format"],
+        )
+
+    output_format = "compact" if options["compact"] else "indented"
+    run_stage(
+        profiler,
+        manifest,
+        "definitions",
+        definition_inputs,
+        [
+            cdn,
+            output_format,
+            "snapshot" if options["snapshot"] else "",
+            # Part of the definitions, and changed by any file.
+            str(index.last_modification(options["date_source"])),
+        ],
+        export_definitions,
+    )
+    run_stage(
+        profiler,
+        manifest,
+        "rust",
+        definition_inputs,
+        [cdn, options["rust_mode"]] + template_names,
+        export_rust,
+    )
+    run_stage(
+        profiler,
+        manifest,
+        "schema",
+        definition_inputs,
+        [
+            cdn,
+            options["schema_mode"],
+            output_format,
+            json.dumps(generic_schema, sort_keys=True),
+        ],
+        export_schema,
+    )
+    run_stage(
+        profiler,
+        manifest,
+        "templates",
+        [os.path.join(source_path, "info.yml")] + index.templates,
+        [cdn],
+        copy_templates,
+    )
+    run_stage(
+        profiler,
+        manifest,
+        "examples",
+        definition_inputs + index.tests,
+        [cdn, output_format, options["examples_format"]],
+        export_examples,
+    )
+    if manifest:
+        manifest.save()
     logging.info("Build folder created!")
 
 
-def run_data() -> None:
-    pattern = os.path.join(SOURCE_ROOT, "**", "info.yml")
-    for path in glob.glob(pattern, recursive=True):
-        logging.info(path)
-        source_path = os.path.dirname(path)
-        target_path = source_path.replace(SOURCE_ROOT, TARGET_ROOT)
-        target_path = os.path.join(target_path, "data/")
-        FileSystemManager.prepare_target(target_path)
-        copy_static_data(source_path, target_path)
+def data_design_system(
+    source_path: str, options: dict[str, Any], profiler: StageProfiler
+) -> None:
+    target_path = source_path.replace(SOURCE_ROOT, TARGET_ROOT)
+    target_path = os.path.join(target_path, "data/")
+    # Not purged: unchanged files are skipped on their size and modification
+    # time, without hashing them, and stale files are deleted. So a manifest
+    # left by a previous incremental build is useless.
+    BuildManifest.remove(target_path)
+    with profiler.measure("static"):
+        copy_static_data(source_path, target_path, options["publish"])
     logging.info("Data folder created!")
 
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "run":
-        cdn = sys.argv[2] if len(sys.argv) > 2 else ""
-        run_build(cdn)
-        run_data()
-    elif len(sys.argv) > 1 and sys.argv[1] == "build":
-        cdn = sys.argv[2] if len(sys.argv) > 2 else ""
-        run_build(cdn)
-    elif len(sys.argv) > 1 and sys.argv[1] == "data":
-        run_data()
+def process_design_system(
+    path: str,
+    steps: list[str],
+    options: dict[str, Any],
+    generic_schema: dict[str, Any],
+    collect: bool,
+) -> dict[str, Any]:
+    """Run build steps on a single design system, without raising on failure"""
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers
+    level = root_logger.level
+    collector = LogCollector()
+    if collect:
+        # Workers started without fork never ran configure_logging().
+        root_logger.handlers = [collector]
+        root_logger.setLevel(logging.INFO)
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    success = True
+    # Workers do not always inherit settings, depending on the start method.
+    YamlLoader.cache_dir = options["cache_dir"]
+    YamlLoader.processes = options["yaml_processes"]
+    source_path = os.path.dirname(path)
+    profile_path = ""
+    if options["profile"]:
+        profile_path = source_path.replace(SOURCE_ROOT, TARGET_ROOT)
+        profile_path = os.path.join(profile_path, "profile/")
+    profiler = StageProfiler(profile_path)
+    try:
+        logging.info(path)
+        if "build" in steps:
+            build_design_system(source_path, options, generic_schema, profiler)
+        if "data" in steps:
+            data_design_system(source_path, options, profiler)
+    except Exception:
+        logging.exception("%s failed", path)
+        success = False
+    finally:
+        root_logger.handlers = handlers
+        root_logger.setLevel(level)
+    return {
+        "path": path,
+        "success": success,
+        "duration": time.perf_counter() - start,
+        "cpu": time.process_time() - start_cpu,
+        "stages": profiler.stages,
+        "logs": collector.records,
+    }
+
+
+def run(steps: list[str], options: dict[str, Any], jobs: int) -> bool:
+    """Process every design system found in the input volume"""
+    paths = find_design_systems()
+    generic_schema = {}
+    if "build" in steps:
+        from SchemaGenerator import SchemaGenerator
+
+        generic_schema = SchemaGenerator.load_generic_schema(
+            options["cache_dir"], options["offline"]
+        )
+    results = []
+    sequential = jobs <= 1 or len(paths) <= 1
+    # Without design systems in parallel, YAML files are parsed in parallel.
+    options = options | {"yaml_processes": jobs if sequential else 0}
+    if sequential:
+        for path in paths:
+            results.append(
+                process_design_system(path, steps, options, generic_schema, False)
+            )
     else:
-        logging.error("Unknown command: %s", sys.argv[1])
-        sys.exit()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    process_design_system, path, steps, options, generic_schema, True
+                ): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as error:
+                    # The worker process itself died (killed, out of memory...)
+                    logging.error("%s failed: %s", futures[future], error)
+                    result = {
+                        "path": futures[future],
+                        "success": False,
+                        "duration": 0.0,
+                        "cpu": 0.0,
+                        "stages": {},
+                        "logs": [],
+                    }
+                for record in result["logs"]:
+                    logging.getLogger().handle(record)
+                results.append(result)
+    log_summary(results)
+    write_report(results, options)
+    return all(result["success"] for result in results)
+
+
+def watch(options: dict[str, Any], polling: bool) -> None:
+    """Build every design system, then rebuild the ones changing until stopped"""
+    # Stages are skipped when their inputs are unchanged, and only the
+    # changed YAML files are parsed again, the other ones are kept in memory.
+    from SchemaGenerator import SchemaGenerator
+    from Watcher import Watcher
+
+    options = options | {"incremental": True, "yaml_processes": 0}
+    YamlLoader.memory = {}
+    generic_schema = SchemaGenerator.load_generic_schema(
+        options["cache_dir"], options["offline"]
+    )
+    steps = ["build", "data"]
+    paths = find_design_systems()
+    results = [
+        process_design_system(path, steps, options, generic_schema, False)
+        for path in paths
+    ]
+    log_summary(results)
+    write_report(results, options)
+    watcher = Watcher(SOURCE_ROOT, polling=polling)
+    logging.info("Watching %s, press Ctrl+C to stop", SOURCE_ROOT)
+    try:
+        while True:
+            changes = watcher.wait()
+            if any(os.path.basename(path) == "info.yml" for path in changes):
+                paths = find_design_systems()
+            results = []
+            for path in paths:
+                root = os.path.dirname(path)
+                if not any(
+                    change == root
+                    or change.startswith(root + "/")
+                    or root.startswith(change + "/")
+                    for change in changes
+                ):
+                    continue
+                SourceIndex.invalidate(root)
+                results.append(
+                    process_design_system(path, steps, options, generic_schema, False)
+                )
+            if results:
+                log_summary(results)
+                write_report(results, options)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def serve(options: dict[str, Any], listen: str) -> None:
+    """Build design systems on request, keeping parsed files and templates warm"""
+    from SchemaGenerator import SchemaGenerator
+    from Server import BuildServer, create_server
+
+    options = options | {"yaml_processes": 0}
+    YamlLoader.memory = {}
+
+    def build(path: str, *args: Any) -> dict[str, Any]:
+        # Sources may have changed since the previous request.
+        SourceIndex.invalidate(os.path.dirname(path))
+        return process_design_system(path, *args)
+
+    build_server = BuildServer(
+        SOURCE_ROOT,
+        options,
+        lambda: SchemaGenerator.load_generic_schema(
+            options["cache_dir"], options["offline"]
+        ),
+        build,
+    )
+    server = create_server(listen, build_server)
+    logging.info("Listening on %s, press Ctrl+C to stop", listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def write_report(results: list[dict[str, Any]], options: dict[str, Any]) -> None:
+    """Write times, memory and outputs of each stage to report.json"""
+    report = {
+        "version": 1,
+        "date": int(time.time()),
+        "options": options,
+        "design_systems": [
+            {key: value for key, value in result.items() if key != "logs"}
+            for result in sorted(results, key=lambda result: result["path"])
+        ],
+    }
+    FileSystemManager.write_json(os.path.join(TARGET_ROOT, "report.json"), report)
+
+
+def log_summary(results: list[dict[str, Any]]) -> None:
+    logging.info("Summary:")
+    for result in sorted(results, key=lambda result: result["path"]):
+        status = "OK" if result["success"] else "FAILED"
+        level = logging.INFO if result["success"] else logging.ERROR
+        logging.log(level, "%-6s %8.2fs %s", status, result["duration"], result["path"])
+
+
+if __name__ == "__main__":
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of design systems built in parallel, default: CPU count",
+    )
+    common.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only rebuild what changed since the previous build",
+    )
+    common.add_argument(
+        "--cache-dir",
+        default=os.environ.get("CACHE_DIR", os.path.join(TARGET_ROOT, ".cache")),
+        help="folder of the parsed YAML cache, empty to disable, "
+        "default: $CACHE_DIR or /data/output/.cache",
+    )
+    common.add_argument(
+        "--profile",
+        action="store_true",
+        help="write a cProfile dump of each stage, in a profile/ folder next "
+        "to build/ and data/",
+    )
+    parser = argparse.ArgumentParser(description="Dilla prebuilder")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ["run", "build", "watch", "serve"]:
+        subparser = commands.add_parser(command, parents=[common])
+        subparser.add_argument("cdn", nargs="?", default="")
+        subparser.add_argument(
+            "--schema-mode",
+            choices=SCHEMA_MODES,
+            default="conditional",
+            help="how renderable.schema.json dispatches on @component",
+        )
+        subparser.add_argument(
+            "--offline",
+            action="store_true",
+            default=bool(os.environ.get("OFFLINE")),
+            help="never fetch the generic schema, use the cached or bundled copy",
+        )
+        subparser.add_argument(
+            "--rust-mode",
+            choices=list(RUST_TEMPLATES.keys()),
+            default="runtime",
+            help="how ds.rs holds the configuration, static needs the phf crate",
+        )
+        subparser.add_argument(
+            "--compact",
+            action="store_true",
+            help="write JSON files without indentation",
+        )
+        subparser.add_argument(
+            "--examples-format",
+            choices=EXAMPLES_FORMATS,
+            default="files",
+            help="a JSON file for each example, or a single bundle with an index",
+        )
+        subparser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="also write definitions.snapshot, a binary indexed copy",
+        )
+    commands.choices["watch"].add_argument(
+        "--poll",
+        action="store_true",
+        help="scan for changes every second, when inotify is not available",
+    )
+    commands.choices["serve"].add_argument(
+        "--listen",
+        default=os.environ.get("LISTEN", "127.0.0.1:8000"),
+        help="host:port or Unix socket path of the API, default: $LISTEN or "
+        "127.0.0.1:8000",
+    )
+    commands.add_parser("data", parents=[common])
+    for subparser in commands.choices.values():
+        subparser.add_argument(
+            "--date-source",
+            choices=DATE_SOURCES,
+            default="mtime",
+            help="where dateModified comes from, when not set in info.yml",
+        )
+        subparser.add_argument(
+            "--publish",
+            choices=PUBLISH_METHODS,
+            default="copy",
+            help="how static files are written to data/, reflink and hardlink "
+            "need the input and output volumes on the same filesystem",
+        )
+    args = parser.parse_args()
+    configure_logging()
+    steps = {"run": ["build", "data"], "build": ["build"], "data": ["data"]}
+    options = {
+        "cdn": getattr(args, "cdn", ""),
+        "incremental": args.incremental,
+        "cache_dir": args.cache_dir,
+        "schema_mode": getattr(args, "schema_mode", "conditional"),
+        "offline": getattr(args, "offline", False),
+        "compact": getattr(args, "compact", False),
+        "rust_mode": getattr(args, "rust_mode", "runtime"),
+        "snapshot": getattr(args, "snapshot", False),
+        "examples_format": getattr(args, "examples_format", "files"),
+        "publish": args.publish,
+        "date_source": args.date_source,
+        "profile": args.profile,
+    }
+    if args.command == "watch":
+        watch(options, args.poll)
+    elif args.command == "serve":
+        # Outputs are kept between requests, which can still ask for a full build.
+        serve(options | {"incremental": True}, args.listen)
+    elif not run(steps[args.command], options, args.jobs):
+        sys.exit(1)